@@ -1,116 +1,322 @@
 #!/usr/bin/env python3
 """
 Script to add @since 1.0.0 tags to PHP class docblocks and public method docblocks.
+
+Usage: python add-phpdoc-tags.py [--verbose] <file_or_directory>
+
+The module is fully annotated and uses plain module-level functions (no
+closures), so it can be AOT-compiled with mypyc for very large trees, e.g.
+copy it to add_phpdoc_tags.py and run `mypyc add_phpdoc_tags.py`. It needs
+nothing beyond the standard library and runs as-is without compiling, under
+CPython or PyPy (`pypy3 .scripts/add-phpdoc-tags.py includes`).
 """
 
+import hashlib
+import json
+import mmap
+import os
 import re
 import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 
-def add_since_to_class_docblock(content):
-    """Add @since tag to class docblock if missing."""
-    # Pattern for class docblock without @since
-    pattern = r'(/\*\*[^*]*\*(?:[^*/][^*]*\*+)*/)(\s*(?:final\s+|abstract\s+)?class\s+)'
-
-    def replacer(match):
-        docblock = match.group(1)
-        class_keyword = match.group(2)
-
-        # Check if @since already exists
-        if '@since' in docblock:
-            return match.group(0)
-
-        # Find the last line before closing */
-        lines = docblock.split('\n')
-        if len(lines) > 1:
-            # Insert @since before the closing */
-            lines.insert(-1, ' *')
-            lines.insert(-1, ' * @since 1.0.0')
-            return '\n'.join(lines) + class_keyword
-
-        return match.group(0)
-
-    return re.sub(pattern, replacer, content, flags=re.DOTALL)
-
-def add_since_to_methods(content):
-    """Add @since tag to public method docblocks if missing."""
-    # Pattern for public method docblock without @since
-    pattern = r'(/\*\*[^*]*\*(?:[^*/][^*]*\*+)*/)(\s*public\s+(?:static\s+)?function\s+)'
-
-    def replacer(match):
-        docblock = match.group(1)
-        function_keyword = match.group(2)
-
-        # Check if @since already exists
-        if '@since' in docblock:
-            return match.group(0)
-
-        # Find position to insert @since (after first line, before @param/@return)
-        lines = docblock.split('\n')
-        if len(lines) > 2:
-            # Find first @param or @return line
-            insert_pos = len(lines) - 1
-            for i, line in enumerate(lines):
-                if '@param' in line or '@return' in line or '@throws' in line:
-                    insert_pos = i
-                    break
-
-            # Insert @since with blank line after
-            lines.insert(insert_pos, ' *')
-            lines.insert(insert_pos, ' * @since 1.0.0')
-            return '\n'.join(lines) + function_keyword
-
-        return match.group(0)
-
-    return re.sub(pattern, replacer, content, flags=re.DOTALL)
-
-def process_file(filepath):
-    """Process a single PHP file to add @since tags."""
-    try:
-        with open(filepath, 'r', encoding='utf-8') as f:
-            content = f.read()
+# Buffers the scanner works on: a read-only file mapping or plain bytes
+Buffer = Union[bytes, mmap.mmap]
+
+# (filepath, updated, error) as returned by process_file
+FileResult = Tuple[Path, bool, Optional[str]]
+
+# Class or public method keyword following a docblock, matched right after
+# its closing */. The class group tells the two apart. Files are scanned as
+# UTF-8 bytes; every pattern and tag here is ASCII. The match is anchored and
+# only sees the few bytes after a docblock (the scan itself is str.find), so
+# the stdlib engine is plenty and no third-party regex module is needed.
+_KEYWORD_RE = re.compile(
+    rb'\s*(?:(?P<class>(?:final\s+|abstract\s+)?class)|public\s+(?:static\s+)?function)\s+'
+)
+
+# Text spliced into docblocks, built once so tagging is pure slicing: class
+# tags go before the closing */ line, method tags go before the first
+# @param/@return/@throws line
+_SINCE_TAG = b' * @since 1.0.0'
+_CLASS_INSERT = b'\n *\n' + _SINCE_TAG
+_METHOD_INSERT = _SINCE_TAG + b'\n *\n'
+
+def tag_class_docblock(docblock: bytes) -> bytes:
+    """Return the class docblock with an @since tag inserted."""
+    # Find the newline that starts the closing */ line
+    cut = docblock.rfind(b'\n')
+    if cut == -1:
+        return docblock
+
+    # Insert @since before the closing */
+    return docblock[:cut] + _CLASS_INSERT + docblock[cut:]
+
+def tag_method_docblock(docblock: bytes) -> bytes:
+    """Return the public method docblock with an @since tag inserted."""
+    # Single-line and two-line docblocks are left alone
+    if docblock.count(b'\n') < 2:
+        return docblock
+
+    # Insert before the first @param/@return/@throws line, or before the
+    # closing */ line when there are none
+    tag_positions = [
+        pos for pos in (
+            docblock.find(b'@param'),
+            docblock.find(b'@return'),
+            docblock.find(b'@throws'),
+        )
+        if pos != -1
+    ]
+    anchor = min(tag_positions) if tag_positions else len(docblock)
+    cut = docblock.rfind(b'\n', 0, anchor) + 1
+
+    # Insert @since with blank line after
+    return docblock[:cut] + _METHOD_INSERT + docblock[cut:]
+
+# File names that never get tags
+_EXCLUDED_NAMES = frozenset(('index.php', 'autoload.php'))
 
-        original = content
+# Per-tree record of files already processed, written to the root directory
+_CACHE_NAME = '.since-cache.json'
 
-        # Add @since to class docblock
-        content = add_since_to_class_docblock(content)
+# Files handed to a worker per task, and batches kept in flight per worker
+_BATCH_SIZE = 32
+_BATCHES_PER_WORKER = 4
 
-        # Add @since to public methods
-        content = add_since_to_methods(content)
+def iter_php_files(root: Path) -> Iterator[Path]:
+    """Yield paths of PHP files under root, skipping excluded names."""
+    stack: List[Union[Path, str]] = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith('.php') and entry.name not in _EXCLUDED_NAMES:
+                    yield Path(entry.path)
 
-        # Only write if content changed
-        if content != original:
-            with open(filepath, 'w', encoding='utf-8') as f:
-                f.write(content)
-            print(f"Updated: {filepath}")
-            return True
+def needs_scan(content: Buffer) -> bool:
+    """Cheap substring check for anything add_since_tags could change."""
+    # mmap only supports single-byte `in` checks, so use find()
+    return content.find(b'/**') != -1 and (
+        content.find(b'class') != -1 or content.find(b'function') != -1
+    )
+
+def add_since_tags(content: Buffer) -> Tuple[Buffer, int]:
+    """
+    Add @since tags to class and public method docblocks in one pass.
+
+    content may be bytes or a read-only mmap; docblocks are only copied out
+    of it one at a time. Returns the new content and the number of docblocks
+    tagged, like re.subn.
+    """
+    parts: List[bytes] = []
+    pos = 0      # start of the next /** search
+    copied = 0   # end of the content already copied into parts
+
+    while True:
+        start = content.find(b'/**', pos)
+        if start == -1:
+            break
+        end = content.find(b'*/', start + 3)
+        if end == -1:
+            break
+        end += 2
+        pos = end
+
+        # Most docblocks (properties, private methods, inline hints) are not
+        # followed by a taggable keyword, so check that before copying
+        keyword = _KEYWORD_RE.match(content, end)
+        if keyword is None:
+            continue
+
+        # Check if @since already exists, searching in place so already
+        # tagged docblocks are never copied either
+        if content.find(b'@since', start, end) != -1:
+            continue
+
+        docblock = content[start:end]
+
+        if keyword.group('class'):
+            tagged = tag_class_docblock(docblock)
         else:
-            print(f"No changes: {filepath}")
-            return False
+            tagged = tag_method_docblock(docblock)
+
+        if tagged is not docblock:
+            parts.append(content[copied:start])
+            parts.append(tagged)
+            copied = end
+
+    if not parts:
+        return content, 0
+
+    tagged_count = len(parts) // 2
+    parts.append(content[copied:])
+    return b''.join(parts), tagged_count
+
+def process_file(filepath: Path) -> FileResult:
+    """
+    Process a single PHP file to add @since tags.
+
+    Returns (filepath, updated, error) so the caller can report results in one
+    place instead of every worker printing as it goes.
+    """
+    try:
+        content: Buffer
+        new_content = b''
+        tagged_count = 0
+        with open(filepath, 'rb') as f:
+            # mmap refuses empty files, and they have nothing to tag anyway
+            if os.fstat(f.fileno()).st_size == 0:
+                return filepath, False, None
+
+            # Scan the mapped file directly rather than reading it into memory
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                content = mapped
+
+                # Match text-mode reading, which translates \r\n and \r to \n
+                if mapped.find(b'\r') != -1:
+                    content = mapped[:].replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+
+                # Add @since to class and public method docblocks, skipping the
+                # scan for files that have no docblock or taggable keyword at all
+                if needs_scan(content):
+                    result, tagged_count = add_since_tags(content)
+                    # Tagged content is always a fresh bytes object, never the mmap
+                    if tagged_count and isinstance(result, bytes):
+                        new_content = result
+
+        # Only write if content changed, and only ever write valid UTF-8
+        if tagged_count:
+            new_content.decode('utf-8')
+            filepath.write_bytes(new_content)
+            return filepath, True, None
+        return filepath, False, None
     except Exception as e:
-        print(f"Error processing {filepath}: {e}")
-        return False
+        return filepath, False, str(e)
+
+def process_batch(filepaths: List[Path]) -> List[FileResult]:
+    """Process a batch of files in one worker task."""
+    return [process_file(filepath) for filepath in filepaths]
+
+def iter_batches(filepaths: Iterable[Path], size: int) -> Iterator[List[Path]]:
+    """Group a stream of paths into lists of at most size paths."""
+    batch: List[Path] = []
+    for filepath in filepaths:
+        batch.append(filepath)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def process_files(executor: ProcessPoolExecutor, filepaths: Iterable[Path], workers: int) -> Iterator[FileResult]:
+    """
+    Stream file results from the pool in input order.
+
+    Unlike executor.map, which submits every input up front, only a few
+    batches per worker are in flight at once, so the directory walk feeding
+    filepaths overlaps with processing and memory stays bounded.
+    """
+    in_flight: deque[Future[List[FileResult]]] = deque()
+    for batch in iter_batches(filepaths, _BATCH_SIZE):
+        in_flight.append(executor.submit(process_batch, batch))
+        if len(in_flight) >= workers * _BATCHES_PER_WORKER:
+            yield from in_flight.popleft().result()
+    while in_flight:
+        yield from in_flight.popleft().result()
+
+def iter_stale_files(root: Path, cache: Dict[str, List[int]], counts: Dict[str, int]) -> Iterator[Path]:
+    """Yield PHP files under root that changed since the cached run, counting skips."""
+    for php_file in iter_php_files(root):
+        if cache.get(str(php_file.relative_to(root))) == file_signature(php_file):
+            counts['skipped'] += 1
+        else:
+            yield php_file
 
-def main():
-    if len(sys.argv) < 2:
-        print("Usage: python add-phpdoc-tags.py <file_or_directory>")
+def report(results: Iterable[FileResult], verbose: bool) -> int:
+    """Print buffered per-file results and return the number of updated files."""
+    lines: List[str] = []
+    updated = 0
+    for filepath, changed, error in results:
+        if error is not None:
+            lines.append(f"Error processing {filepath}: {error}")
+        elif changed:
+            updated += 1
+            if verbose:
+                lines.append(f"Updated: {filepath}")
+        elif verbose:
+            lines.append(f"No changes: {filepath}")
+
+    if lines:
+        print('\n'.join(lines))
+    return updated
+
+def script_hash() -> str:
+    """Hash of this script, so editing it invalidates old caches."""
+    return hashlib.sha1(Path(__file__).read_bytes()).hexdigest()
+
+def load_cache(cache_path: Path, script: str) -> Dict[str, List[int]]:
+    """Return the {relative path: [mtime_ns, size]} map from a previous run."""
+    try:
+        data = json.loads(cache_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('script') != script:
+        return {}
+    files = data.get('files')
+    return files if isinstance(files, dict) else {}
+
+def save_cache(cache_path: Path, script: str, files: Dict[str, List[int]]) -> None:
+    """Write the processed-file map for the next run."""
+    try:
+        cache_path.write_text(json.dumps({'script': script, 'files': files}), encoding='utf-8')
+    except OSError as e:
+        print(f"Could not write cache {cache_path}: {e}")
+
+def file_signature(filepath: Path) -> List[int]:
+    """Cheap change detector for a file: [mtime_ns, size]."""
+    st = filepath.stat()
+    return [st.st_mtime_ns, st.st_size]
+
+def main() -> None:
+    args = [arg for arg in sys.argv[1:] if arg not in ('-v', '--verbose')]
+    verbose = len(args) < len(sys.argv) - 1
+
+    if len(args) != 1:
+        print("Usage: python add-phpdoc-tags.py [--verbose] <file_or_directory>")
         sys.exit(1)
 
-    path = Path(sys.argv[1])
+    path = Path(args[0])
 
     if path.is_file():
-        process_file(path)
+        updated = report([process_file(path)], verbose)
+        print(f"Processed 1 file, updated {updated}")
     elif path.is_dir():
-        php_files = list(path.rglob('*.php'))
-        # Exclude index.php and autoload.php
-        php_files = [f for f in php_files if f.name not in ['index.php', 'autoload.php']]
+        # Skip files untouched since a previous run of this same script
+        cache_path = path / _CACHE_NAME
+        script = script_hash()
+        cache = load_cache(cache_path, script)
+        counts = {'skipped': 0}
+
+        # Files are independent, so spread them across all cores, feeding
+        # the pool straight from the directory walk
+        workers = os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(process_files(executor, iter_stale_files(path, cache, counts), workers))
+
+        updated = report(results, verbose)
 
-        updated = 0
-        for php_file in php_files:
-            if process_file(php_file):
-                updated += 1
+        # Record files processed cleanly, after any rewrite
+        for filepath, _, error in results:
+            if error is None:
+                cache[str(filepath.relative_to(path))] = file_signature(filepath)
+        save_cache(cache_path, script, cache)
 
-        print(f"\nProcessed {len(php_files)} files, updated {updated}")
+        skipped = counts['skipped']
+        print(f"\nProcessed {len(results) + skipped} files, updated {updated}, skipped {skipped} unchanged")
     else:
         print(f"Path not found: {path}")
         sys.exit(1)
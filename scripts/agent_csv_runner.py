@@ -2,16 +2,29 @@
 from __future__ import annotations
 
 import argparse
+import copy
 import csv
+import functools
+import hashlib
 import json
+import os
+import queue
+import random
 import re
+import select
 import shutil
 import subprocess
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+try:  # optional: faster JSON for state, handoff and stream-json parsing
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
 
 
 DEFAULTS: Dict[str, Any] = {
@@ -69,7 +82,7 @@ DEFAULTS: Dict[str, Any] = {
     },
 }
 
-TASK_ID_RE = re.compile(r"^[A-Za-z0-9]+(?:-[A-Za-z0-9]+)+$")
+VALID_AGENTS = frozenset(("codex", "claude", "gemini", "copilot"))
 
 
 @dataclass
@@ -80,23 +93,64 @@ class RunResult:
     stderr: str
 
 
+# Argument lists for the git calls made on every handoff
+_GIT_STATUS_CMD = ("git", "status", "--porcelain=v1", "--branch")
+_GIT_DIFF_STAT_CMD = ("git", "diff", "--stat")
+
+# now_iso() formats the date/time part once per second and reuses it
+_iso_second = -1
+_iso_prefix = ""
+
+
 def now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+    """UTC timestamp like 2024-01-02T03:04:05.123456Z (fraction omitted when zero)."""
+    global _iso_second, _iso_prefix
+    second, ns = divmod(time.time_ns(), 1_000_000_000)
+    if second != _iso_second:
+        _iso_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+        _iso_second = second
+    micros = ns // 1000
+    return f"{_iso_prefix}.{micros:06d}Z" if micros else f"{_iso_prefix}Z"
 
 
 def log(msg: str, level: str = "INFO") -> None:
     print(f"[{now_iso()}] {level}: {msg}", flush=True)
 
 
-def run(cmd: List[str], cwd: Path, *, stdin_text: Optional[str] = None) -> RunResult:
-    p = subprocess.run(
-        cmd,
-        cwd=str(cwd),
-        input=stdin_text,
-        text=True,
-        capture_output=True,
-    )
-    return RunResult(cmd=cmd, returncode=p.returncode, stdout=p.stdout, stderr=p.stderr)
+def run(
+    cmd: List[str],
+    cwd: Path,
+    *,
+    stdin_text: Optional[str] = None,
+    output_path: Optional[Path] = None,
+) -> RunResult:
+    """
+    Run cmd and capture its output. With output_path, stdout goes straight to
+    that file (followed by a newline and stderr, the raw log layout) and is
+    not kept in memory: the result's stdout is empty.
+    """
+    if output_path is None:
+        p = subprocess.run(
+            cmd,
+            cwd=str(cwd),
+            input=stdin_text,
+            text=True,
+            capture_output=True,
+        )
+        return RunResult(cmd=cmd, returncode=p.returncode, stdout=p.stdout, stderr=p.stderr)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with output_path.open("wb") as out:
+        p = subprocess.run(
+            cmd,
+            cwd=str(cwd),
+            input=stdin_text,
+            text=True,
+            stdout=out,
+            stderr=subprocess.PIPE,
+        )
+        out.write(("\n" + p.stderr).encode("utf-8"))
+    return RunResult(cmd=cmd, returncode=p.returncode, stdout="", stderr=p.stderr)
 
 
 def run_stream_lines(
@@ -109,6 +163,9 @@ def run_stream_lines(
     """
     Stream stdout (and merged stderr) line-by-line to on_line(line).
     Returns combined output in stdout field; stderr is empty (merged).
+
+    A reader thread drains the pipe into a bounded queue so a slow on_line
+    callback does not stall the child on a full pipe.
     """
     p = subprocess.Popen(
         cmd,
@@ -117,20 +174,36 @@ def run_stream_lines(
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
         text=True,
-        bufsize=1,
-        universal_newlines=True,
+        bufsize=-1,  # block-buffered pipe; lines are split on the Python side
     )
     assert p.stdout is not None
+    lines: "queue.Queue[Optional[str]]" = queue.Queue(maxsize=1024)
+
+    def pump(stream) -> None:
+        for line in stream:
+            lines.put(line)
+        lines.put(None)
+
+    # Start draining before feeding stdin so a chatty child can't deadlock
+    # against a large prompt.
+    reader = threading.Thread(target=pump, args=(p.stdout,), daemon=True)
+    reader.start()
+
     if stdin_text is not None:
         assert p.stdin is not None
         p.stdin.write(stdin_text)
         p.stdin.close()
 
     out_lines: List[str] = []
-    for line in p.stdout:
+    while True:
+        line = lines.get()
+        if line is None:
+            break
         out_lines.append(line)
         on_line(line.rstrip("\n"))
 
+    reader.join()
+
     rc = p.wait()
     return RunResult(cmd=cmd, returncode=rc, stdout="".join(out_lines), stderr="")
 
@@ -142,22 +215,131 @@ def git_root(start: Path) -> Path:
     return Path(rr.stdout.strip())
 
 
+if orjson is not None:
+
+    def json_loads(s: Union[str, bytes]) -> Any:
+        return orjson.loads(s)
+
+    def json_dumps(obj: Any) -> str:
+        """Indented (2 spaces) JSON text."""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode("utf-8")
+
+else:
+
+    def json_loads(s: Union[str, bytes]) -> Any:
+        return json.loads(s)
+
+    def json_dumps(obj: Any) -> str:
+        """Indented (2 spaces) JSON text."""
+        return json.dumps(obj, indent=2)
+
+
 def load_json(path: Path) -> Dict[str, Any]:
     if not path.exists():
         return {}
-    return json.loads(path.read_text(encoding="utf-8"))
+    return json_loads(path.read_text(encoding="utf-8"))
+
+
+# fdatasync is not available everywhere (e.g. macOS); fsync is the fallback
+_fdatasync = getattr(os, "fdatasync", os.fsync)
 
 
 def write_json(path: Path, data: Dict[str, Any]) -> None:
+    # Write a sibling temp file, sync it and swap it in, so a resume never
+    # reads a half-written file, even after a crash.
     path.parent.mkdir(parents=True, exist_ok=True)
-    path.write_text(json.dumps(data, indent=2) + "\n", encoding="utf-8")
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        f.write((json_dumps(data) + "\n").encode("utf-8"))
+        f.flush()
+        _fdatasync(f.fileno())
+    os.replace(tmp, path)
+
+
+def write_text_if_changed(path: Path, text: str) -> bool:
+    """Write text (UTF-8) unless the file already holds exactly that; True if written."""
+    data = text.encode("utf-8")
+    try:
+        with path.open("rb") as f:
+            # Only read the old contents when the sizes match
+            if os.fstat(f.fileno()).st_size == len(data) and f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    path.write_bytes(data)
+    return True
 
 
-def deep_merge(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
-    out = dict(a)
-    for k, v in b.items():
+class StateWriter(threading.Thread):
+    """
+    Writes the state file on a background thread, the only writer of that
+    file. submit() may be called from any thread and never touches the disk;
+    snapshots submitted while a write is pending are coalesced, so only the
+    latest one is serialized.
+    After the first change the writer waits debounce_s before writing, so the
+    per-stage updates of a task usually collapse into one write; flush()
+    writes immediately (done at the end of each task) and raises if the write
+    fails.
+    """
+
+    def __init__(self, path: Path, *, debounce_s: float = 2.0) -> None:
+        super().__init__(name="state-writer", daemon=True)
+        self.path = path
+        self.debounce_s = debounce_s
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._closing = threading.Event()
+        self._pending: Optional[Dict[str, Any]] = None
+
+    def submit(self, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._pending = data
+        self._dirty.set()
+
+    def flush(self) -> None:
+        with self._write_lock:
+            with self._lock:
+                data, self._pending = self._pending, None
+            if data is None:
+                return
+            try:
+                write_json(self.path, data)
+            except Exception:
+                # Keep the snapshot for the next flush unless a newer one came in
+                with self._lock:
+                    if self._pending is None:
+                        self._pending = data
+                raise
+
+    def run(self) -> None:
+        while not self._closing.is_set():
+            if self._dirty.wait(timeout=0.5):
+                self._closing.wait(self.debounce_s)
+                self._dirty.clear()
+                # A failed write must not end the thread; the snapshot stays
+                # pending and the next flush() from the main thread raises.
+                try:
+                    self.flush()
+                except Exception as e:
+                    log(f"Could not write state file {self.path}: {e}", "WARN")
+
+    def close(self) -> None:
+        self._closing.set()
+        self._dirty.set()
+        self.join()
+        self.flush()
+
+
+def merge_defaults(overrides: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Fresh copy of DEFAULTS with overrides applied. DEFAULTS only nests one
+    level deep, so updating each section dict is a full merge.
+    """
+    out = copy.deepcopy(DEFAULTS)
+    for k, v in overrides.items():
         if isinstance(v, dict) and isinstance(out.get(k), dict):
-            out[k] = deep_merge(out[k], v)
+            out[k].update(v)
         else:
             out[k] = v
     return out
@@ -167,7 +349,16 @@ def sanitize_task_id(s: str) -> str:
     s = (s or "").strip()
     if not s:
         raise ValueError("Empty task id.")
-    if not TASK_ID_RE.fullmatch(s):
+    # Same grammar as ^[A-Za-z0-9]+(?:-[A-Za-z0-9]+)+$ using plain str checks:
+    # ASCII alphanumeric runs joined by single dashes, at least two runs.
+    if not (
+        s.isascii()
+        and s.replace("-", "").isalnum()
+        and "-" in s
+        and s[0] != "-"
+        and s[-1] != "-"
+        and "--" not in s
+    ):
         raise ValueError(f"Bad task id '{s}'. Expected like T2-2 or M02-T2-3.")
     return s
 
@@ -180,10 +371,36 @@ def pick_col(fieldnames: List[str], candidates: List[str]) -> Optional[str]:
     return None
 
 
+def col_index(fieldnames: List[str], col: Optional[str]) -> int:
+    """Index of column col in fieldnames (last one wins, like csv.DictReader), or -1."""
+    if col is None:
+        return -1
+    return len(fieldnames) - 1 - fieldnames[::-1].index(col)
+
+
+def iter_csv_rows(csv_path: Path) -> Iterator[List[str]]:
+    """
+    Yield the header row ([] if missing), then every non-blank row (DictReader
+    skips blank lines too), streaming so large CSVs are never held in memory.
+    """
+    with csv_path.open("r", newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        yield next(reader, [])
+        for row in reader:
+            if row:
+                yield row
+
+
+def cell(row: List[str], idx: int) -> str:
+    """Value at idx in a csv.reader row; missing columns read as empty."""
+    return row[idx] if 0 <= idx < len(row) else ""
+
+
 def which_or_none(cmd: str) -> Optional[str]:
     return shutil.which(cmd)
 
 
+@functools.lru_cache(maxsize=None)
 def ensure_cli_available(agent: str, repo: Path, *, strict: bool) -> bool:
     if agent == "codex":
         if not which_or_none("codex"):
@@ -246,56 +463,277 @@ def ensure_cli_available(agent: str, repo: Path, *, strict: bool) -> bool:
 def read_after_prompts(dir_path: Path) -> List[Tuple[str, str]]:
     if not dir_path.exists():
         return []
-    files = sorted([p for p in dir_path.iterdir() if p.is_file() and p.suffix.lower() in [".md", ".txt"]])
-    out: List[Tuple[str, str]] = []
-    for p in files:
-        t = p.read_text(encoding="utf-8").strip()
-        if t:
-            out.append((p.name, t))
-    return out
+    # scandir entries carry their file type, so no extra stat per entry.
+    with os.scandir(dir_path) as entries:
+        files = sorted(
+            Path(e.path) for e in entries if e.is_file() and os.path.splitext(e.name)[1].lower() in (".md", ".txt")
+        )
+
+    def read_prompt(p: Path) -> Tuple[str, str]:
+        return p.name, p.read_text(encoding="utf-8").strip()
+
+    # Small I/O-bound reads: overlap them; map() keeps the sorted order.
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        return [(name, t) for name, t in pool.map(read_prompt, files) if t]
+
+
+@functools.lru_cache(maxsize=None)
+def _inotify_simple() -> Any:
+    """
+    The optional inotify_simple module, or None. Imported on first use, since
+    it is only needed once a run is actually paused.
+    """
+    try:
+        import inotify_simple
+    except ImportError:  # pragma: no cover - depends on environment
+        return None
+    return inotify_simple
+
+
+class _InotifyWatcher:
+    """Directory watcher backed by inotify (optional inotify_simple package)."""
+
+    def __init__(self, dirs: Sequence[Path]) -> None:
+        inotify_simple = _inotify_simple()
+        flags = inotify_simple.flags
+        mask = flags.CREATE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO
+        self._ino = inotify_simple.INotify()
+        try:
+            for d in dirs:
+                self._ino.add_watch(str(d), mask)
+        except OSError:
+            self._ino.close()
+            raise
+
+    def wait(self, timeout_s: float) -> None:
+        self._ino.read(timeout=int(timeout_s * 1000))
+
+    def close(self) -> None:
+        self._ino.close()
+
+
+class _KqueueWatcher:
+    """Directory watcher backed by kqueue (BSD/macOS)."""
+
+    def __init__(self, dirs: Sequence[Path]) -> None:
+        self._kq = select.kqueue()
+        self._fds: List[int] = []
+        try:
+            events = []
+            for d in dirs:
+                fd = os.open(str(d), os.O_RDONLY)
+                self._fds.append(fd)
+                events.append(
+                    select.kevent(
+                        fd,
+                        filter=select.KQ_FILTER_VNODE,
+                        flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                        fflags=select.KQ_NOTE_WRITE | select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME,
+                    )
+                )
+            self._kq.control(events, 0)
+        except OSError:
+            self.close()
+            raise
+
+    def wait(self, timeout_s: float) -> None:
+        self._kq.control(None, 1, timeout_s)
+
+    def close(self) -> None:
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+        self._kq.close()
+
+
+def open_dir_watcher(dirs: Sequence[Path]):
+    """
+    Watch dirs for entries being created/removed; wait(timeout_s) returns on
+    the first change or after the timeout. Returns None when no event source is
+    available, so callers can fall back to polling.
+    """
+    unique = list(dict.fromkeys(dirs))
+    try:
+        if _inotify_simple() is not None:
+            return _InotifyWatcher(unique)
+        if hasattr(select, "kqueue"):
+            return _KqueueWatcher(unique)
+    except OSError:
+        pass
+    return None
 
 
 def wait_if_paused(pause_file: Path, stop_file: Path, *, interval_s: float, where: str) -> None:
-    while pause_file.exists():
-        log(f"PAUSED at {where}. Remove '{pause_file}' to continue.", "PAUSE")
-        if stop_file.exists():
-            return
-        time.sleep(interval_s)
+    if not pause_file.exists():
+        return
+    # Wake up as soon as the pause/stop files change instead of sleeping a full
+    # interval; the interval still bounds each wait so the PAUSED log repeats.
+    # Without a watcher, poll with exponential backoff from 50ms up to the
+    # interval so a short pause resumes almost at once; PAUSED is still only
+    # logged once per interval.
+    watcher = open_dir_watcher([pause_file.parent, stop_file.parent])
+    try:
+        backoff_s = 0.05
+        next_log = 0.0
+        while pause_file.exists():
+            if time.monotonic() >= next_log:
+                log(f"PAUSED at {where}. Remove '{pause_file}' to continue.", "PAUSE")
+                next_log = time.monotonic() + interval_s
+            if stop_file.exists():
+                return
+            if watcher is not None:
+                watcher.wait(interval_s)
+            else:
+                time.sleep(backoff_s)
+                backoff_s = min(backoff_s * 1.5, interval_s)
+    finally:
+        if watcher is not None:
+            watcher.close()
 
 
 def stop_requested(stop_file: Path) -> bool:
     return stop_file.exists()
 
 
-def safe_read(path: Path, max_chars: int = 20000) -> str:
-    if not path.exists():
-        return ""
-    data = path.read_text(encoding="utf-8", errors="replace")
-    if len(data) <= max_chars:
-        return data
-    return data[:max_chars] + "\n\n...[truncated]...\n"
+def safe_read_chunks(path: Path, max_chars: int = 20000, chunk_chars: int = 8192) -> Iterator[str]:
+    """
+    Yield up to max_chars of path in chunks, then a truncation marker if more
+    remains, so a large file is never read into memory just to be cut down.
+    """
+    try:
+        f = path.open("r", encoding="utf-8", errors="replace")
+    except FileNotFoundError:
+        return
+    with f:
+        remaining = max_chars
+        while remaining > 0:
+            chunk = f.read(min(chunk_chars, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+        if f.read(1):
+            yield "\n\n...[truncated]...\n"
+
+
+def _branch_from_status_header(line: str) -> str:
+    """
+    Branch name from a `git status --branch` header, matching what
+    `git rev-parse --abbrev-ref HEAD` prints.
+    """
+    head = line[3:] if line.startswith("## ") else ""
+    if not head or head.startswith(("No commits yet on ", "Initial commit on ")):
+        return "(unknown)"  # unborn branch: rev-parse fails here too
+    if head.startswith("HEAD (no branch)"):
+        return "HEAD"
+    return head.split("...", 1)[0].split(" ", 1)[0]
 
 
-def git_snapshot(repo: Path) -> str:
-    parts: List[str] = []
-    b = run(["git", "rev-parse", "--abbrev-ref", "HEAD"], cwd=repo)
-    parts.append(f"branch: {b.stdout.strip() if b.returncode == 0 else '(unknown)'}")
+def worktree_fingerprint(repo: Path, exclude: Sequence[Path] = ()) -> Optional[str]:
+    """
+    Digest of HEAD plus the content of every changed or untracked file, so two
+    equal fingerprints mean verification would see the same tree. Paths under
+    `exclude` (the runner's own plans, logs, handoffs and state) are left out.
+    None if git fails.
+    """
+    head = run(["git", "rev-parse", "HEAD"], cwd=repo)
+    pathspecs = [f":(exclude){p.relative_to(repo).as_posix()}" for p in exclude if p != repo and p.is_relative_to(repo)]
+    st = run(["git", "status", "--porcelain=v1", "-z", "--untracked-files=all", "--", *pathspecs], cwd=repo)
+    if head.returncode != 0 or st.returncode != 0:
+        return None
+    h = hashlib.blake2b(head.stdout.encode("utf-8"), digest_size=16)
+    h.update(st.stdout.encode("utf-8"))
+    # -z entries are "XY path", renames followed by their source path
+    entries = st.stdout.split("\0")
+    paths: List[str] = []
+    i = 0
+    while i < len(entries):
+        entry = entries[i]
+        i += 1
+        if len(entry) < 4:
+            continue
+        if entry[0] in "RC":
+            i += 1
+        path = entry[3:]
+        if (repo / path).is_file():
+            paths.append(path)
+    if paths:
+        ho = run(["git", "hash-object", "--stdin-paths"], cwd=repo, stdin_text="\n".join(paths) + "\n")
+        if ho.returncode != 0:
+            return None
+        h.update(ho.stdout.encode("utf-8"))
+    return h.hexdigest()
 
-    st = run(["git", "status", "--porcelain=v1"], cwd=repo)
-    parts.append("status:\n" + (st.stdout.strip() or "(clean)"))
 
-    ds = run(["git", "diff", "--stat"], cwd=repo)
-    parts.append("diff --stat:\n" + (ds.stdout.strip() or "(no diff)"))
+def git_snapshot(repo: Path) -> str:
+    parts: List[str] = []
+    # One status call yields both the branch (header line) and the file list
+    st = run(list(_GIT_STATUS_CMD), cwd=repo)
+    header, _, status = st.stdout.partition("\n")
+    branch = _branch_from_status_header(header) if st.returncode == 0 else "(unknown)"
+    parts.append(f"branch: {branch}")
+    parts.append("status:\n" + (status.strip() or "(clean)"))
+
+    # `git diff --stat` only covers unstaged changes to tracked files; when no
+    # status line has a worktree change (second column) it would print
+    # nothing, so skip the second scan of the working tree.
+    diff_stat = ""
+    if st.returncode != 0 or any(len(ln) > 1 and ln[1] not in " ?!" for ln in status.splitlines()):
+        diff_stat = run(list(_GIT_DIFF_STAT_CMD), cwd=repo).stdout.strip()
+    parts.append("diff --stat:\n" + (diff_stat or "(no diff)"))
 
     return "\n\n".join(parts).strip() + "\n"
 
 
-def append_handoff(handoff_path: Path, *, header: str, body: str) -> None:
-    handoff_path.parent.mkdir(parents=True, exist_ok=True)
-    if not handoff_path.exists():
-        handoff_path.write_text(f"# Handoff\n\nCreated: {now_iso()}\n\n", encoding="utf-8")
-    with handoff_path.open("a", encoding="utf-8") as f:
-        f.write(f"\n\n## {header}\n\n{body}\n")
+class HandoffLog:
+    """
+    A task's handoff file, opened once and kept open for appends. Each section
+    is flushed as soon as it is written, since agents read the file.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._f: Optional[Any] = None
+
+    def append(self, *, header: str, body: Union[str, Iterable[str]]) -> None:
+        """Append a section; body may be a string or an iterable of chunks written in order."""
+        f = self._f
+        if f is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            f = self._f = self.path.open("a", encoding="utf-8", buffering=65536)
+            if f.tell() == 0:
+                f.write(f"# Handoff\n\nCreated: {now_iso()}\n\n")
+        f.write(f"\n\n## {header}\n\n")
+        if isinstance(body, str):
+            f.write(body)
+        else:
+            for chunk in body:
+                f.write(chunk)
+        f.write("\n")
+        f.flush()
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+
+
+def agent_handoff_body(
+    cmd_str: str,
+    returncode: int,
+    last_path: Path,
+    repo: Path,
+    *,
+    session_line: Optional[str] = None,
+) -> Iterator[str]:
+    """Handoff section for an agent run, streamed straight from the last-message file."""
+    yield f"Command:\n```\n{cmd_str}\n```\n\n"
+    yield f"Return code: {returncode}\n\n"
+    if session_line is not None:
+        yield f"{session_line}\n\n"
+    yield f"Agent final message (file: {last_path.parent.name}/{last_path.name}):\n\n"
+    yield from safe_read_chunks(last_path)
+    yield f"\n\nRepo snapshot:\n```\n{git_snapshot(repo)}\n```"
 
 
 @dataclass
@@ -306,6 +744,7 @@ class TaskSessions:
     copilot_session_id: Optional[str] = None
 
 
+@functools.lru_cache(maxsize=64)
 def normalize_gemini_model(name: str) -> str:
     s = (name or "").strip()
     if not s:
@@ -337,7 +776,7 @@ class AgentRunner:
         repo: Path,
         cfg: Dict[str, Any],
         log_dir: Path,
-        handoff_path: Path,
+        handoff: HandoffLog,
         sessions: TaskSessions,
         *,
         verbose: bool,
@@ -345,9 +784,38 @@ class AgentRunner:
         self.repo = repo
         self.cfg = cfg
         self.log_dir = log_dir
-        self.handoff_path = handoff_path
+        self.handoff = handoff
         self.sessions = sessions
         self.verbose = verbose
+        self._task_log_dirs: Set[str] = set()
+
+    # The config is fixed for the run, so each CLI's base args are built once,
+    # on first use: a section for an agent the run never calls is never read.
+    @functools.cached_property
+    def _codex_base(self) -> Tuple[str, ...]:
+        return ("codex", "exec", *self._codex_args())
+
+    @functools.cached_property
+    def _claude_base(self) -> Tuple[str, ...]:
+        return ("claude", *self._claude_args())
+
+    @functools.cached_property
+    def _gemini_bases(self) -> Dict[str, Tuple[str, ...]]:
+        # Gemini switches to stream-json to capture a session id, so both
+        # output formats are prepared.
+        g = self.cfg.get("gemini", {})
+        gemini_model = str(g.get("model") or "auto").strip()
+        gemini_outfmt = str(g.get("output_format") or "json").strip()
+        gemini_args = self._gemini_args(model=gemini_model)
+        return {fmt: ("gemini", "--output-format", fmt, *gemini_args) for fmt in {gemini_outfmt, "stream-json"}}
+
+    def _log_path(self, task_id: str, name: str) -> Path:
+        """Log file path under the per-task log directory (created on first use)."""
+        d = self.log_dir / task_id
+        if task_id not in self._task_log_dirs:
+            d.mkdir(parents=True, exist_ok=True)
+            self._task_log_dirs.add(task_id)
+        return d / name
 
     # ---- Codex ----
     def _codex_args(self) -> List[str]:
@@ -369,35 +837,29 @@ class AgentRunner:
         return args
 
     def codex_run(self, prompt: str, *, stage: str, task_id: str) -> RunResult:
-        last_path = self.log_dir / f"{task_id}.codex.{stage}.last.md"
-        raw_path = self.log_dir / f"{task_id}.codex.{stage}.raw.txt"
+        last_path = self._log_path(task_id, f"codex.{stage}.last.md")
+        raw_path = self._log_path(task_id, f"codex.{stage}.raw.txt")
 
-        base = ["codex", "exec"] + self._codex_args() + ["--output-last-message", str(last_path)]
+        base = [*self._codex_base, "--output-last-message", str(last_path)]
         if self.sessions.codex_started:
             cmd = base + ["resume", "--last", "-"]
         else:
             cmd = base + ["-"]
 
+        cmd_str = " ".join(cmd)
         if self.verbose:
-            log(f"CMD: {' '.join(cmd)}", "CMD")
+            log(f"CMD: {cmd_str}", "CMD")
 
-        rr = run(cmd, cwd=self.repo, stdin_text=prompt)
-        raw_path.parent.mkdir(parents=True, exist_ok=True)
-        raw_path.write_text(rr.stdout + "\n" + rr.stderr, encoding="utf-8")
+        # Codex's reply is read from last_path, so its (often large) stdout
+        # only needs to reach the raw log.
+        rr = run(cmd, cwd=self.repo, stdin_text=prompt, output_path=raw_path)
 
         if rr.returncode == 0:
             self.sessions.codex_started = True
 
-        append_handoff(
-            self.handoff_path,
+        self.handoff.append(
             header=f"{now_iso()} — codex — {stage}",
-            body=(
-                f"Command:\n```\n{' '.join(cmd)}\n```\n\n"
-                f"Return code: {rr.returncode}\n\n"
-                f"Agent final message (file: {last_path.name}):\n\n"
-                f"{safe_read(last_path)}\n\n"
-                f"Repo snapshot:\n```\n{git_snapshot(self.repo)}\n```"
-            ),
+            body=agent_handoff_body(cmd_str, rr.returncode, last_path, self.repo),
         )
         return rr
 
@@ -432,19 +894,20 @@ class AgentRunner:
         return args
 
     def claude_run(self, prompt: str, *, stage: str, task_id: str) -> Tuple[RunResult, Optional[str]]:
-        last_path = self.log_dir / f"{task_id}.claude.{stage}.last.md"
-        raw_path = self.log_dir / f"{task_id}.claude.{stage}.raw.txt"
+        last_path = self._log_path(task_id, f"claude.{stage}.last.md")
+        raw_path = self._log_path(task_id, f"claude.{stage}.raw.txt")
 
         c = self.cfg.get("claude", {})
         outfmt = str((c.get("output_format") or "json")).strip()
 
-        cmd = ["claude"] + self._claude_args()
+        cmd = list(self._claude_base)
         if self.sessions.claude_session_id:
             cmd += ["--resume", self.sessions.claude_session_id]
         cmd += [prompt]
 
+        cmd_str = " ".join(cmd)
         if self.verbose:
-            log(f"CMD: {' '.join(cmd)}", "CMD")
+            log(f"CMD: {cmd_str}", "CMD")
 
         rr = run(cmd, cwd=self.repo)
         raw_path.parent.mkdir(parents=True, exist_ok=True)
@@ -454,7 +917,7 @@ class AgentRunner:
         new_session_id = None
         if rr.returncode == 0 and outfmt == "json":
             try:
-                obj = json.loads(rr.stdout)
+                obj = json_loads(rr.stdout)
                 new_session_id = obj.get("session_id")
                 result_text = (obj.get("result") or "").strip()
             except Exception:
@@ -466,24 +929,23 @@ class AgentRunner:
         last_path.parent.mkdir(parents=True, exist_ok=True)
         last_path.write_text(result_text + "\n", encoding="utf-8")
 
-        append_handoff(
-            self.handoff_path,
+        self.handoff.append(
             header=f"{now_iso()} — claude — {stage}",
-            body=(
-                f"Command:\n```\n{' '.join(cmd)}\n```\n\n"
-                f"Return code: {rr.returncode}\n\n"
-                f"Session: {self.sessions.claude_session_id or '(unknown)'}\n\n"
-                f"Agent final message (file: {last_path.name}):\n\n"
-                f"{safe_read(last_path)}\n\n"
-                f"Repo snapshot:\n```\n{git_snapshot(self.repo)}\n```"
+            body=agent_handoff_body(
+                cmd_str,
+                rr.returncode,
+                last_path,
+                self.repo,
+                session_line=f"Session: {self.sessions.claude_session_id or '(unknown)'}",
             ),
         )
         return rr, self.sessions.claude_session_id
 
     # ---- Gemini CLI ----
-    def _gemini_args(self, *, output_format: str, model: str) -> List[str]:
+    def _gemini_args(self, *, model: str) -> List[str]:
+        """Args after --output-format, which differs between runs."""
         g = self.cfg.get("gemini", {})
-        args: List[str] = ["--output-format", output_format]
+        args: List[str] = []
 
         m = normalize_gemini_model(model)
         if m:
@@ -517,7 +979,6 @@ class AgentRunner:
 
     def gemini_run(self, prompt: str, *, stage: str, task_id: str) -> Tuple[RunResult, Optional[str]]:
         g = self.cfg.get("gemini", {})
-        desired_model = str(g.get("model") or "auto").strip()
         configured_outfmt = str(g.get("output_format") or "json").strip()
 
         resume_strategy = str(g.get("resume_strategy") or "per_task").strip()
@@ -532,12 +993,12 @@ class AgentRunner:
         if force_stream:
             outfmt = "stream-json"
 
-        last_path = self.log_dir / f"{task_id}.gemini.{stage}.last.md"
-        raw_path = self.log_dir / f"{task_id}.gemini.{stage}.raw.txt"
-        json_path = self.log_dir / f"{task_id}.gemini.{stage}.json"
-        jsonl_path = self.log_dir / f"{task_id}.gemini.{stage}.jsonl"
+        last_path = self._log_path(task_id, f"gemini.{stage}.last.md")
+        raw_path = self._log_path(task_id, f"gemini.{stage}.raw.txt")
+        json_path = self._log_path(task_id, f"gemini.{stage}.json")
+        jsonl_path = self._log_path(task_id, f"gemini.{stage}.jsonl")
 
-        cmd = ["gemini"] + self._gemini_args(output_format=outfmt, model=desired_model)
+        cmd = list(self._gemini_bases[outfmt])
 
         # Resume support
         if resume_strategy == "latest":
@@ -545,8 +1006,9 @@ class AgentRunner:
         elif resume_strategy == "per_task" and self.sessions.gemini_session_id:
             cmd += ["--resume", self.sessions.gemini_session_id]
 
+        cmd_str = " ".join(cmd)
         if self.verbose:
-            log(f"CMD: {' '.join(cmd)} (prompt via stdin)", "CMD")
+            log(f"CMD: {cmd_str} (prompt via stdin)", "CMD")
 
         session_id: Optional[str] = self.sessions.gemini_session_id
         final_text = ""
@@ -561,13 +1023,11 @@ class AgentRunner:
             def handle_line(line: str) -> None:
                 nonlocal session_id, result_status
                 # Write raw line
-                with raw_path.open("a", encoding="utf-8") as f:
-                    f.write(line + "\n")
-                with jsonl_path.open("a", encoding="utf-8") as f:
-                    f.write(line + "\n")
+                raw_f.write(line + "\n")
+                jsonl_f.write(line + "\n")
                 # Parse event
                 try:
-                    evt = json.loads(line)
+                    evt = json_loads(line)
                 except Exception:
                     return
                 et = evt.get("type")
@@ -596,12 +1056,13 @@ class AgentRunner:
                 elif et == "result":
                     result_status = str(evt.get("status") or "").lower()
 
-            # Ensure raw files start empty
+            # Raw files start empty and stay open for the whole stream, so events
+            # are written through one buffer instead of an open/append per line.
             raw_path.parent.mkdir(parents=True, exist_ok=True)
-            raw_path.write_text("", encoding="utf-8")
-            jsonl_path.write_text("", encoding="utf-8")
-
-            rr = run_stream_lines(cmd, cwd=self.repo, stdin_text=prompt, on_line=handle_line)
+            with raw_path.open("w", encoding="utf-8", buffering=65536) as raw_f, jsonl_path.open(
+                "w", encoding="utf-8", buffering=65536
+            ) as jsonl_f:
+                rr = run_stream_lines(cmd, cwd=self.repo, stdin_text=prompt, on_line=handle_line)
 
             # Determine success
             if rr.returncode != 0:
@@ -620,13 +1081,12 @@ class AgentRunner:
             # Save a json summary too
             json_path.parent.mkdir(parents=True, exist_ok=True)
             json_path.write_text(
-                json.dumps(
+                json_dumps(
                     {
                         "session_id": session_id,
                         "result_status": result_status,
                         "errors": errors,
-                    },
-                    indent=2,
+                    }
                 )
                 + "\n",
                 encoding="utf-8",
@@ -644,9 +1104,9 @@ class AgentRunner:
 
             if outfmt == "json":
                 try:
-                    obj = json.loads(rr.stdout) if rr.stdout.strip().startswith("{") else {}
+                    obj = json_loads(rr.stdout) if rr.stdout.strip().startswith("{") else {}
                     json_path.parent.mkdir(parents=True, exist_ok=True)
-                    json_path.write_text(json.dumps(obj, indent=2) + "\n", encoding="utf-8")
+                    json_path.write_text(json_dumps(obj) + "\n", encoding="utf-8")
                     if isinstance(obj, dict) and obj.get("error"):
                         e = obj.get("error") or {}
                         error_summary = f"{e.get('type','Error')}: {e.get('message','')}".strip()
@@ -664,16 +1124,14 @@ class AgentRunner:
         last_path.parent.mkdir(parents=True, exist_ok=True)
         last_path.write_text((final_text or "").strip() + "\n", encoding="utf-8")
 
-        append_handoff(
-            self.handoff_path,
+        self.handoff.append(
             header=f"{now_iso()} — gemini — {stage}",
-            body=(
-                f"Command:\n```\n{' '.join(cmd)}\n```\n\n"
-                f"Return code: {rr.returncode}\n\n"
-                f"Session: {session_id or '(unknown)'}\n\n"
-                f"Agent final message (file: {last_path.name}):\n\n"
-                f"{safe_read(last_path)}\n\n"
-                f"Repo snapshot:\n```\n{git_snapshot(self.repo)}\n```"
+            body=agent_handoff_body(
+                cmd_str,
+                rr.returncode,
+                last_path,
+                self.repo,
+                session_line=f"Session: {session_id or '(unknown)'}",
             ),
         )
         return rr, session_id
@@ -704,13 +1162,14 @@ class AgentRunner:
         return args
 
     def copilot_run(self, prompt: str, *, stage: str, task_id: str) -> Tuple[RunResult, Optional[str]]:
-        last_path = self.log_dir / f"{task_id}.copilot.{stage}.last.md"
-        raw_path = self.log_dir / f"{task_id}.copilot.{stage}.raw.txt"
+        last_path = self._log_path(task_id, f"copilot.{stage}.last.md")
+        raw_path = self._log_path(task_id, f"copilot.{stage}.raw.txt")
 
         cmd = ["copilot"] + self._copilot_args(prompt)
 
+        cmd_str = " ".join(cmd)
         if self.verbose:
-            log(f"CMD: {' '.join(cmd)}", "CMD")
+            log(f"CMD: {cmd_str}", "CMD")
 
         rr = run(cmd, cwd=self.repo)
         raw_path.parent.mkdir(parents=True, exist_ok=True)
@@ -721,16 +1180,9 @@ class AgentRunner:
         last_path.parent.mkdir(parents=True, exist_ok=True)
         last_path.write_text(result_text + "\n", encoding="utf-8")
 
-        append_handoff(
-            self.handoff_path,
+        self.handoff.append(
             header=f"{now_iso()} — copilot — {stage}",
-            body=(
-                f"Command:\n```\n{' '.join(cmd)}\n```\n\n"
-                f"Return code: {rr.returncode}\n\n"
-                f"Agent final message (file: {last_path.name}):\n\n"
-                f"{safe_read(last_path)}\n\n"
-                f"Repo snapshot:\n```\n{git_snapshot(self.repo)}\n```"
-            ),
+            body=agent_handoff_body(cmd_str, rr.returncode, last_path, self.repo),
         )
         return rr, None
 
@@ -776,27 +1228,71 @@ def build_after_prompt(task_id: str, spec_rel: str, handoff_rel: str, prompt_tex
     )
 
 
-def run_verify(repo: Path, commands: Dict[str, str], *, verbose: bool) -> List[Tuple[str, str]]:
-    failures: List[Tuple[str, str]] = []
-    for key in ["format", "lint", "test"]:
-        cmd = (commands.get(key) or "").strip()
-        if not cmd:
-            continue
+def run_verify(repo: Path, commands: Dict[str, str], *, verbose: bool, parallel: bool = False) -> List[Tuple[str, str]]:
+    """
+    Run the format/lint/test commands and return (cmd, output) for failures,
+    in that order. Format rewrites files, so it always runs alone first; with
+    parallel, lint and test then run at the same time.
+    """
+    steps = [(key, cmd) for key in ["format", "lint", "test"] if (cmd := (commands.get(key) or "").strip())]
+
+    def check(step: Tuple[str, str]) -> Optional[Tuple[str, str]]:
+        key, cmd = step
         if verbose:
             log(f"VERIFY {key}: {cmd}", "VERIFY")
         rr = run(["bash", "-lc", cmd], cwd=repo)
         if rr.returncode != 0:
-            failures.append((cmd, (rr.stdout + "\n" + rr.stderr).strip()))
             log(f"Verify FAILED ({key})", "FAIL")
-        else:
-            log(f"Verify OK ({key})", "OK")
-    return failures
+            return cmd, (rr.stdout + "\n" + rr.stderr).strip()
+        log(f"Verify OK ({key})", "OK")
+        return None
+
+    if parallel and len(steps) > 1:
+        first = [check(steps[0])] if steps[0][0] == "format" else []
+        with ThreadPoolExecutor(max_workers=len(steps)) as pool:
+            results = first + list(pool.map(check, steps[len(first):]))
+    else:
+        results = [check(step) for step in steps]
+    return [f for f in results if f is not None]
+
+
+# Agent exit codes that a retry cannot fix: the CLI could not be executed or
+# was not found (126/127), or it was interrupted (130).
+NON_RETRYABLE_EXIT_CODES = frozenset({126, 127, 130})
+
+
+class AgentBreaker:
+    """
+    Per-agent circuit breaker shared by all tasks of a run. After `threshold`
+    failed runs in a row an agent is skipped for a cool-off (30s, doubling with
+    each further failure up to 10 minutes, jittered); a success resets it.
+    """
+
+    def __init__(self, threshold: int = 3) -> None:
+        self.threshold = threshold
+        self._fails: Dict[str, int] = {}
+        self._open_until: Dict[str, float] = {}
+
+    def is_open(self, agent: str) -> bool:
+        return self._open_until.get(agent, 0.0) > time.monotonic()
+
+    def record(self, agent: str, ok: bool) -> None:
+        if ok:
+            self._fails.pop(agent, None)
+            self._open_until.pop(agent, None)
+            return
+        fails = self._fails.get(agent, 0) + 1
+        self._fails[agent] = fails
+        if fails >= self.threshold:
+            cool_s = min(30.0 * 2 ** (fails - self.threshold), 600.0) * random.uniform(0.5, 1.0)
+            self._open_until[agent] = time.monotonic() + cool_s
+            log(f"{agent} failed {fails} times in a row; skipping it for {cool_s:.0f}s", "WARN")
 
 
 def _parse_agent_list(s: str) -> List[str]:
     out: List[str] = []
     for p in [x.strip().lower() for x in s.split(",") if x.strip()]:
-        if p in {"codex", "claude", "gemini", "copilot"} and p not in out:
+        if p in VALID_AGENTS and p not in out:
             out.append(p)
     return out
 
@@ -817,10 +1313,16 @@ def main() -> int:
     ap.add_argument("--verbose", action="store_true", help="Verbose console logging.")
     ap.add_argument("--pause-after-task", action="store_true", help="Pause after each task until pause file removed.")
     ap.add_argument("--pause-check-interval", type=float, default=5.0, help="Seconds between pause checks.")
+    ap.add_argument(
+        "--parallel-verify",
+        action=argparse.BooleanOptionalAction,
+        default=True,
+        help="Run the lint and test commands concurrently (after format). Default on.",
+    )
     args = ap.parse_args()
 
     repo = git_root(Path.cwd())
-    cfg = deep_merge(DEFAULTS, load_json(repo / args.config))
+    cfg = merge_defaults(load_json(repo / args.config))
 
     plan_dir = repo / str(cfg["plan_dir"])
     log_dir = repo / str(cfg["log_dir"])
@@ -829,6 +1331,8 @@ def main() -> int:
     after_dir = repo / str(cfg["after_prompts_dir"])
     pause_file = repo / str(cfg["pause_file"])
     stop_file = repo / str(cfg["stop_file"])
+    # What the runner itself writes; left out of the after-prompts tree check
+    runner_outputs = (plan_dir, log_dir, handoff_dir, state_file)
 
     for d in [plan_dir, log_dir, handoff_dir, after_dir, pause_file.parent, stop_file.parent]:
         d.mkdir(parents=True, exist_ok=True)
@@ -840,28 +1344,35 @@ def main() -> int:
         fallback_order = _parse_agent_list(args.fallback_order)
     else:
         fallback_order = _as_list(cfg.get("agents", {}).get("fallback_order", []))
-        fallback_order = [x.lower() for x in fallback_order if str(x).lower() in {"codex", "claude", "gemini", "copilot"}]
+        fallback_order = [x.lower() for x in fallback_order if str(x).lower() in VALID_AGENTS]
 
     # Remove primary if present
     fallback_order = [a for a in fallback_order if a != primary_default]
 
-    ensure_cli_available(primary_default, repo, strict=True)
-    checked_fallbacks: List[str] = []
-    for a in fallback_order:
-        if ensure_cli_available(a, repo, strict=False):
-            checked_fallbacks.append(a)
-        else:
-            log(f"Fallback agent '{a}' not available; skipping.", "WARN")
+    # Probe all CLIs at once; each probe is dominated by subprocess start-up.
+    with ThreadPoolExecutor(max_workers=len(fallback_order) + 1) as pool:
+        primary_check = pool.submit(ensure_cli_available, primary_default, repo, strict=True)
+        fallback_checks = [(a, pool.submit(ensure_cli_available, a, repo, strict=False)) for a in fallback_order]
+        primary_check.result()
+        checked_fallbacks: List[str] = []
+        for a, check in fallback_checks:
+            if check.result():
+                checked_fallbacks.append(a)
+            else:
+                log(f"Fallback agent '{a}' not available; skipping.", "WARN")
     fallback_order = checked_fallbacks
 
     after_prompts = read_after_prompts(after_dir)
 
     state = load_json(state_file) if args.resume else {}
-    done_ids = set(state.get("completed_task_ids", []))
+    # Insertion-ordered set: loaded sorted, then ids are appended as tasks finish,
+    # so persisting it needs no re-sort.
+    done_ids: Dict[str, None] = dict.fromkeys(sorted(state.get("completed_task_ids", [])))
 
     claude_sessions: Dict[str, str] = state.get("claude_sessions", {}) if isinstance(state.get("claude_sessions", {}), dict) else {}
     gemini_sessions: Dict[str, str] = state.get("gemini_sessions", {}) if isinstance(state.get("gemini_sessions", {}), dict) else {}
     copilot_sessions: Dict[str, str] = state.get("copilot_sessions", {}) if isinstance(state.get("copilot_sessions", {}), dict) else {}
+    task_digests: Dict[str, str] = state.get("task_digests", {}) if isinstance(state.get("task_digests", {}), dict) else {}
 
     commands = cfg.get("commands", {})
     retries = int(cfg.get("retries", 2))
@@ -871,261 +1382,328 @@ def main() -> int:
     if not csv_path.is_absolute():
         csv_path = (Path.cwd() / csv_path).resolve()
 
-    with csv_path.open("r", newline="", encoding="utf-8-sig") as f:
-        reader = csv.DictReader(f)
-        if not reader.fieldnames:
-            raise SystemExit("CSV must have headers.")
-        fields = reader.fieldnames
-        rows = list(reader)
+    # Plain csv.reader rows: columns are resolved to indices once below
+    # instead of building a dict per row. Rows are streamed twice, once to
+    # count them for progress and once to run them, rather than kept in a list.
+    fields = next(iter_csv_rows(csv_path))
+    if not fields:
+        raise SystemExit("CSV must have headers.")
+    total = sum(1 for _ in iter_csv_rows(csv_path)) - 1
 
     id_col = pick_col(fields, ["id", "task_id", "task"])
     title_col = pick_col(fields, ["title", "name"])
     spec_col = pick_col(fields, ["spec", "details", "description", "prompt", "body"])
     agent_col = pick_col(fields, ["agent", "backend", "engine", "runner"])
+    id_idx = col_index(fields, id_col)
+    title_idx = col_index(fields, title_col)
+    spec_idx = col_index(fields, spec_col)
+    agent_idx = col_index(fields, agent_col)
+    # Rows without spec text get one from their other columns
+    spec_fallback_cols = [(i, k) for i, k in enumerate(fields) if k not in {id_col, title_col, agent_col}]
 
     log(f"Repo: {repo}")
     log(f"Primary agent: {primary_default}  Fallback chain: {fallback_order or '(none)'}")
-    log(f"CSV rows: {len(rows)}  id_col={id_col} spec_col={spec_col} agent_col={agent_col}")
+    log(f"CSV rows: {total}  id_col={id_col} spec_col={spec_col} agent_col={agent_col}")
     log(f"After prompts: {len(after_prompts)} from {after_dir}")
     log(f"Pause file: {pause_file}  Stop file: {stop_file}")
     log(f"Resume: {args.resume}  Completed: {len(done_ids)}")
 
-    total = len(rows)
-    for idx, row in enumerate(rows, start=1):
-        wait_if_paused(pause_file, stop_file, interval_s=args.pause_check_interval, where=f"before row {idx}/{total}")
-        if stop_requested(stop_file):
-            log("STOP requested. Exiting.", "STOP")
-            return 0
+    # Repo-relative spec/handoff paths for prompts, as prefixes for the task file names
+    def rel_prefix(d: Path) -> str:
+        rel = str(d.relative_to(repo))
+        return "" if rel == "." else rel + os.sep
+
+    plan_rel_prefix = rel_prefix(plan_dir)
+    handoff_rel_prefix = rel_prefix(handoff_dir)
+
+    # Tasks that already have a handoff file: one directory listing up front
+    # instead of an exists() check per task.
+    with os.scandir(handoff_dir) as entries:
+        handoffs_seen = {e.name[:-3] for e in entries if e.name.endswith(".md")}
+
+    handoff: Optional[HandoffLog] = None
+    breaker = AgentBreaker()
+    # With --commit, one push at the end covers every task's commit
+    unpushed_commits = 0
+    state_writer = StateWriter(state_file)
+    state_writer.start()
+    try:
+        # Tasks run strictly one after another: every stage of a task (impl,
+        # verify, fix, after prompts, commit) works on the same checkout, so
+        # overlapping task N's verify with task N+1's impl would test and
+        # commit a mix of both tasks' changes.
+        series = (args.series or "T2").strip().strip("-")  # ids for rows without one
+        rows = iter_csv_rows(csv_path)
+        next(rows)  # header
+        for idx, row in enumerate(rows, start=1):
+            wait_if_paused(pause_file, stop_file, interval_s=args.pause_check_interval, where=f"before row {idx}/{total}")
+            if stop_requested(stop_file):
+                log("STOP requested. Exiting.", "STOP")
+                return 0
 
-        if id_col and (row.get(id_col) or "").strip():
-            task_id = sanitize_task_id(row[id_col])
-        else:
-            series = (args.series or "T2").strip().strip("-")
-            task_id = sanitize_task_id(f"{series}-{idx}")
+            row_id = cell(row, id_idx).strip()
+            row_agent = cell(row, agent_idx).strip().lower()
+            title = cell(row, title_idx).strip()
+            spec = cell(row, spec_idx).strip()
 
-        if task_id in done_ids:
-            log(f"[{idx}/{total}] skip {task_id} (already done)", "SKIP")
-            continue
+            task_id = sanitize_task_id(row_id or f"{series}-{idx}")
 
-        row_agent = (row.get(agent_col) or "").strip().lower() if agent_col else ""
-        primary = primary_default
-        if row_agent in {"codex", "claude", "gemini", "copilot"}:
-            primary = row_agent
-
-        title = (row.get(title_col) or "").strip() if title_col else ""
-        spec = (row.get(spec_col) or "").strip() if spec_col else ""
-        if not spec:
-            parts = []
-            for k, v in row.items():
-                if k in {id_col, title_col, agent_col}:
-                    continue
-                vv = (v or "").strip()
-                if vv:
-                    parts.append(f"{k}: {vv}")
-            spec = "\n".join(parts).strip()
-        if not spec:
-            raise SystemExit(f"{task_id}: no spec text found (row {idx}).")
-
-        spec_path = plan_dir / f"{task_id}.md"
-        spec_path.write_text(f"# {task_id}" + (f" — {title}" if title else "") + "\n\n" + spec + "\n", encoding="utf-8")
-
-        handoff_path = handoff_dir / f"{task_id}.md"
-        if not handoff_path.exists():
-            handoff_path.write_text(
-                f"# Handoff: {task_id}\n\nCreated: {now_iso()}\n\nSpec: {spec_path.relative_to(repo)}\n",
-                encoding="utf-8",
-            )
+            if not spec:
+                spec = "\n".join(f"{k}: {vv}" for i, k in spec_fallback_cols if (vv := cell(row, i).strip())).strip()
+            spec_text = f"# {task_id}" + (f" — {title}" if title else "") + "\n\n" + spec + "\n"
+            spec_digest = hashlib.blake2b(spec_text.encode("utf-8"), digest_size=16).hexdigest()
 
-        sessions = TaskSessions(
-            codex_started=False,
-            claude_session_id=claude_sessions.get(task_id),
-            gemini_session_id=gemini_sessions.get(task_id),
-            copilot_session_id=copilot_sessions.get(task_id),
-        )
-        runner = AgentRunner(repo, cfg, log_dir, handoff_path, sessions, verbose=args.verbose)
+            # Completed tasks are skipped unless their spec changed since (tasks
+            # completed before digests were recorded are always skipped).
+            if task_id in done_ids:
+                if task_digests.get(task_id, spec_digest) == spec_digest:
+                    log(f"[{idx}/{total}] skip {task_id} (already done)", "SKIP")
+                    continue
+                log(f"[{idx}/{total}] {task_id} spec changed since it was done; running it again", "TASK")
+                del done_ids[task_id]
+
+            if not spec:
+                raise SystemExit(f"{task_id}: no spec text found (row {idx}).")
+
+            primary = primary_default
+            if row_agent in VALID_AGENTS:
+                primary = row_agent
+
+            spec_path = plan_dir / f"{task_id}.md"
+            write_text_if_changed(spec_path, spec_text)
+
+            handoff_path = handoff_dir / f"{task_id}.md"
+            spec_rel = f"{plan_rel_prefix}{task_id}.md"
+            handoff_rel = f"{handoff_rel_prefix}{task_id}.md"
+            if task_id not in handoffs_seen:
+                handoffs_seen.add(task_id)
+                handoff_path.write_text(
+                    f"# Handoff: {task_id}\n\nCreated: {now_iso()}\n\nSpec: {spec_rel}\n",
+                    encoding="utf-8",
+                )
 
-        log(f"[{idx}/{total}] START {task_id} (primary={primary}, fallbacks={fallback_order})", "TASK")
+            sessions = TaskSessions(
+                codex_started=False,
+                claude_session_id=claude_sessions.get(task_id),
+                gemini_session_id=gemini_sessions.get(task_id),
+                copilot_session_id=copilot_sessions.get(task_id),
+            )
+            handoff = HandoffLog(handoff_path)
+            runner = AgentRunner(repo, cfg, log_dir, handoff, sessions, verbose=args.verbose)
 
-        spec_rel = str(spec_path.relative_to(repo))
-        handoff_rel = str(handoff_path.relative_to(repo))
+            log(f"[{idx}/{total}] START {task_id} (primary={primary}, fallbacks={fallback_order})", "TASK")
 
-        def run_stage(agent: str, *, stage: str, prompt: str) -> RunResult:
-            nonlocal sessions
-            if agent == "codex":
-                return runner.codex_run(prompt, stage=stage, task_id=task_id)
-            if agent == "claude":
-                rr, sid = runner.claude_run(prompt, stage=stage, task_id=task_id)
-                if sid:
-                    claude_sessions[task_id] = sid
-                return rr
-            if agent == "gemini":
-                rr, sid = runner.gemini_run(prompt, stage=stage, task_id=task_id)
-                if sid:
-                    gemini_sessions[task_id] = sid
-                return rr
-            if agent == "copilot":
-                rr, sid = runner.copilot_run(prompt, stage=stage, task_id=task_id)
-                if sid:
-                    copilot_sessions[task_id] = sid
+            def run_stage(agent: str, *, stage: str, prompt: str) -> RunResult:
+                nonlocal sessions
+                if agent == "codex":
+                    rr = runner.codex_run(prompt, stage=stage, task_id=task_id)
+                elif agent == "claude":
+                    rr, sid = runner.claude_run(prompt, stage=stage, task_id=task_id)
+                    if sid:
+                        claude_sessions[task_id] = sid
+                elif agent == "gemini":
+                    rr, sid = runner.gemini_run(prompt, stage=stage, task_id=task_id)
+                    if sid:
+                        gemini_sessions[task_id] = sid
+                elif agent == "copilot":
+                    rr, sid = runner.copilot_run(prompt, stage=stage, task_id=task_id)
+                    if sid:
+                        copilot_sessions[task_id] = sid
+                else:
+                    raise SystemExit(f"Unknown agent '{agent}'")
+                breaker.record(agent, rr.returncode == 0)
                 return rr
-            raise SystemExit(f"Unknown agent '{agent}'")
-
-        def agent_try_order(primary_agent: str) -> List[str]:
-            out = [primary_agent]
-            for a in fallback_order:
-                if a != primary_agent and a not in out:
-                    out.append(a)
-            return out
-
-        # Persist sessions on any stage that updated them
-        def persist_state() -> None:
-            state["completed_task_ids"] = sorted(done_ids)
-            state["claude_sessions"] = claude_sessions
-            state["gemini_sessions"] = gemini_sessions
-            state["copilot_sessions"] = copilot_sessions
-            state["updated_at"] = now_iso()
-            write_json(state_file, state)
-
-        # 1) Implement
-        impl_prompt = build_impl_prompt(task_id, spec_rel, handoff_rel, commands)
-        impl_agent_used: Optional[str] = None
-        for a in agent_try_order(primary):
-            wait_if_paused(pause_file, stop_file, interval_s=args.pause_check_interval, where=f"{task_id} before impl ({a})")
-            if stop_requested(stop_file):
-                log("STOP requested. Exiting.", "STOP")
-                return 0
-            log(f"{task_id}: IMPLEMENT using {a}", "STEP")
-            rr = run_stage(a, stage="impl", prompt=impl_prompt)
-            persist_state()
-            if rr.returncode == 0:
-                impl_agent_used = a
-                break
-            log(f"{task_id}: impl failed with {a} (exit {rr.returncode})", "WARN")
-        if not impl_agent_used:
-            log(f"{task_id}: impl failed with all agents.", "ERROR")
-            return 1
-
-        # 2) Verify + fix loops
-        wait_if_paused(pause_file, stop_file, interval_s=args.pause_check_interval, where=f"{task_id} before verification")
-        if stop_requested(stop_file):
-            log("STOP requested. Exiting.", "STOP")
-            return 0
-
-        failures = run_verify(repo, commands, verbose=args.verbose)
-        if failures:
-            append_handoff(
-                handoff_path,
-                header=f"{now_iso()} — verify — FAIL",
-                body="\n\n".join([f"Command:\n```\n{c}\n```\n\nOutput:\n```\n{o}\n```" for c, o in failures]),
-            )
 
-        def fix_with(agent: str, max_attempts: int) -> bool:
-            nonlocal failures
-            for attempt in range(1, max_attempts + 1):
-                if not failures:
-                    return True
-                wait_if_paused(pause_file, stop_file, interval_s=args.pause_check_interval, where=f"{task_id} before fix {attempt} ({agent})")
+            def agent_try_order(primary_agent: str) -> List[str]:
+                out = [primary_agent]
+                for a in fallback_order:
+                    if a != primary_agent and a not in out:
+                        out.append(a)
+                # Skip agents that keep failing, unless that leaves none
+                return [a for a in out if not breaker.is_open(a)] or out
+
+            # Persist sessions on any stage that updated them
+            def persist_state() -> None:
+                state["completed_task_ids"] = list(done_ids)
+                state["claude_sessions"] = claude_sessions
+                state["gemini_sessions"] = gemini_sessions
+                state["copilot_sessions"] = copilot_sessions
+                state["task_digests"] = task_digests
+                state["updated_at"] = now_iso()
+                # Hand the writer a snapshot; the session dicts keep changing.
+                state_writer.submit(
+                    {
+                        **state,
+                        "claude_sessions": dict(claude_sessions),
+                        "gemini_sessions": dict(gemini_sessions),
+                        "copilot_sessions": dict(copilot_sessions),
+                        "task_digests": dict(task_digests),
+                    }
+                )
+
+            # 1) Implement
+            impl_prompt = build_impl_prompt(task_id, spec_rel, handoff_rel, commands)
+            impl_agent_used: Optional[str] = None
+            for a in agent_try_order(primary):
+                wait_if_paused(pause_file, stop_file, interval_s=args.pause_check_interval, where=f"{task_id} before impl ({a})")
                 if stop_requested(stop_file):
-                    return False
-                log(f"{task_id}: FIX attempt {attempt}/{max_attempts} using {agent}", "STEP")
-                fix_prompt = build_fix_prompt(task_id, spec_rel, handoff_rel)
-                rr = run_stage(agent, stage=f"fix{attempt}", prompt=fix_prompt)
+                    log("STOP requested. Exiting.", "STOP")
+                    return 0
+                log(f"{task_id}: IMPLEMENT using {a}", "STEP")
+                rr = run_stage(a, stage="impl", prompt=impl_prompt)
                 persist_state()
-                if rr.returncode != 0:
-                    log(f"{task_id}: fix attempt failed at CLI level (exit {rr.returncode})", "WARN")
-                failures = run_verify(repo, commands, verbose=args.verbose)
-                if failures:
-                    append_handoff(
-                        handoff_path,
-                        header=f"{now_iso()} — verify — still FAIL (after {agent} fix{attempt})",
-                        body="\n\n".join([f"Command:\n```\n{c}\n```\n\nOutput:\n```\n{o}\n```" for c, o in failures]),
-                    )
-                else:
-                    append_handoff(handoff_path, header=f"{now_iso()} — verify — PASS", body="All verification commands passed.")
-                    return True
-            return not failures
-
-        if failures:
-            ok = fix_with(impl_agent_used, retries)
-            if not ok:
-                # try other agents in chain
-                for a in agent_try_order(impl_agent_used):
-                    if a == impl_agent_used:
-                        continue
-                    log(f"{task_id}: switching agent for fixes: {a}", "SWITCH")
-                    ok = fix_with(a, retries)
-                    if ok:
-                        break
-            if not ok:
-                log(f"{task_id}: verification still failing after retries.", "ERROR")
+                if rr.returncode == 0:
+                    impl_agent_used = a
+                    break
+                log(f"{task_id}: impl failed with {a} (exit {rr.returncode})", "WARN")
+            if not impl_agent_used:
+                log(f"{task_id}: impl failed with all agents.", "ERROR")
                 return 1
 
-        # 3) After prompts
-        after_agent = str(cfg.get("agents", {}).get("after_agent", "same") or "same").strip()
-        if after_agent == "same":
-            after_agent = impl_agent_used
-        if after_agent not in {"codex", "claude", "gemini", "copilot"}:
-            after_agent = impl_agent_used
-
-        for j, (fname, ptext) in enumerate(after_prompts, start=1):
-            wait_if_paused(pause_file, stop_file, interval_s=args.pause_check_interval, where=f"{task_id} before after-prompt {j}")
+            # 2) Verify + fix loops
+            wait_if_paused(pause_file, stop_file, interval_s=args.pause_check_interval, where=f"{task_id} before verification")
             if stop_requested(stop_file):
                 log("STOP requested. Exiting.", "STOP")
                 return 0
 
-            prompt = build_after_prompt(task_id, spec_rel, handoff_rel, ptext)
-            log(f"{task_id}: AFTER {j}/{len(after_prompts)} ({fname}) using {after_agent}", "AFTER")
-            rr = run_stage(after_agent, stage=f"after{j}", prompt=prompt)
-            persist_state()
-            if rr.returncode != 0:
-                # try fallbacks
-                for a in agent_try_order(after_agent):
-                    if a == after_agent:
-                        continue
-                    log(f"{task_id}: after-prompt failed with {after_agent}; trying {a}", "SWITCH")
-                    rr2 = run_stage(a, stage=f"after{j}.fallback.{a}", prompt=prompt)
-                    persist_state()
-                    if rr2.returncode == 0:
-                        break
-
-        if verify_after_prompts:
-            failures = run_verify(repo, commands, verbose=args.verbose)
+            failures = run_verify(repo, commands, verbose=args.verbose, parallel=args.parallel_verify)
             if failures:
-                log(f"{task_id}: verification failed after after-prompts.", "ERROR")
-                append_handoff(
-                    handoff_path,
-                    header=f"{now_iso()} — verify-after-prompts — FAIL",
+                handoff.append(
+                    header=f"{now_iso()} — verify — FAIL",
                     body="\n\n".join([f"Command:\n```\n{c}\n```\n\nOutput:\n```\n{o}\n```" for c, o in failures]),
                 )
-                ok = fix_with(after_agent, retries)
+
+            # The fix prompt only points at the spec and handoff, so it is the
+            # same for every attempt and agent.
+            fix_prompt = build_fix_prompt(task_id, spec_rel, handoff_rel)
+
+            def fix_with(agent: str, max_attempts: int) -> bool:
+                nonlocal failures
+                for attempt in range(1, max_attempts + 1):
+                    if not failures:
+                        return True
+                    wait_if_paused(pause_file, stop_file, interval_s=args.pause_check_interval, where=f"{task_id} before fix {attempt} ({agent})")
+                    if stop_requested(stop_file):
+                        return False
+                    log(f"{task_id}: FIX attempt {attempt}/{max_attempts} using {agent}", "STEP")
+                    rr = run_stage(agent, stage=f"fix{attempt}", prompt=fix_prompt)
+                    persist_state()
+                    if rr.returncode in NON_RETRYABLE_EXIT_CODES:
+                        log(f"{task_id}: {agent} cannot run (exit {rr.returncode}); not retrying it", "WARN")
+                        return False
+                    if rr.returncode != 0:
+                        log(f"{task_id}: fix attempt failed at CLI level (exit {rr.returncode})", "WARN")
+                    failures = run_verify(repo, commands, verbose=args.verbose, parallel=args.parallel_verify)
+                    if failures:
+                        handoff.append(
+                            header=f"{now_iso()} — verify — still FAIL (after {agent} fix{attempt})",
+                            body="\n\n".join([f"Command:\n```\n{c}\n```\n\nOutput:\n```\n{o}\n```" for c, o in failures]),
+                        )
+                    else:
+                        handoff.append(header=f"{now_iso()} — verify — PASS", body="All verification commands passed.")
+                        return True
+                return not failures
+
+            if failures:
+                ok = fix_with(impl_agent_used, retries)
                 if not ok:
-                    for a in agent_try_order(after_agent):
-                        if a == after_agent:
+                    # try other agents in chain
+                    for a in agent_try_order(impl_agent_used):
+                        if a == impl_agent_used:
                             continue
+                        log(f"{task_id}: switching agent for fixes: {a}", "SWITCH")
                         ok = fix_with(a, retries)
                         if ok:
                             break
                 if not ok:
+                    log(f"{task_id}: verification still failing after retries.", "ERROR")
                     return 1
 
-        # 4) Commit + state
-        if args.commit:
-            log(f"{task_id}: committing changes", "GIT")
-            run(["git", "add", "-A"], cwd=repo)
-            cm = run(["git", "commit", "-m", f"{task_id}: implement"], cwd=repo)
-            run(["git", "push", "origin"], cwd=repo)
-            (log_dir / f"{task_id}.gitcommit.txt").write_text(cm.stdout + "\n" + cm.stderr, encoding="utf-8")
-
-        done_ids.add(task_id)
-        persist_state()
-        log(f"[{idx}/{total}] DONE {task_id}", "DONE")
+            # The tree that just passed verification; if the after prompts leave
+            # it as is, verifying it again is redundant.
+            verified_tree = worktree_fingerprint(repo, runner_outputs) if verify_after_prompts else None
+
+            # 3) After prompts
+            after_agent = str(cfg.get("agents", {}).get("after_agent", "same") or "same").strip()
+            if after_agent == "same":
+                after_agent = impl_agent_used
+            if after_agent not in VALID_AGENTS:
+                after_agent = impl_agent_used
+
+            # After prompts run in file order: each one resumes the task's agent
+            # session and may build on the edits of the previous one.
+            for j, (fname, ptext) in enumerate(after_prompts, start=1):
+                wait_if_paused(pause_file, stop_file, interval_s=args.pause_check_interval, where=f"{task_id} before after-prompt {j}")
+                if stop_requested(stop_file):
+                    log("STOP requested. Exiting.", "STOP")
+                    return 0
 
-        if args.pause_after_task:
-            pause_file.touch(exist_ok=True)
-            wait_if_paused(pause_file, stop_file, interval_s=args.pause_check_interval, where=f"after task {task_id}")
+                prompt = build_after_prompt(task_id, spec_rel, handoff_rel, ptext)
+                log(f"{task_id}: AFTER {j}/{len(after_prompts)} ({fname}) using {after_agent}", "AFTER")
+                rr = run_stage(after_agent, stage=f"after{j}", prompt=prompt)
+                persist_state()
+                if rr.returncode != 0:
+                    # try fallbacks
+                    for a in agent_try_order(after_agent):
+                        if a == after_agent:
+                            continue
+                        log(f"{task_id}: after-prompt failed with {after_agent}; trying {a}", "SWITCH")
+                        rr2 = run_stage(a, stage=f"after{j}.fallback.{a}", prompt=prompt)
+                        persist_state()
+                        if rr2.returncode == 0:
+                            break
 
-    log("All tasks completed.", "DONE")
-    return 0
+            if verify_after_prompts and verified_tree is not None and worktree_fingerprint(repo, runner_outputs) == verified_tree:
+                log(f"{task_id}: verify-after-prompts skipped (tree unchanged)", "VERIFY")
+            elif verify_after_prompts:
+                failures = run_verify(repo, commands, verbose=args.verbose, parallel=args.parallel_verify)
+                if failures:
+                    log(f"{task_id}: verification failed after after-prompts.", "ERROR")
+                    handoff.append(
+                        header=f"{now_iso()} — verify-after-prompts — FAIL",
+                        body="\n\n".join([f"Command:\n```\n{c}\n```\n\nOutput:\n```\n{o}\n```" for c, o in failures]),
+                    )
+                    ok = fix_with(after_agent, retries)
+                    if not ok:
+                        for a in agent_try_order(after_agent):
+                            if a == after_agent:
+                                continue
+                            ok = fix_with(a, retries)
+                            if ok:
+                                break
+                    if not ok:
+                        return 1
+
+            # 4) Commit + state
+            if args.commit:
+                log(f"{task_id}: committing changes", "GIT")
+                run(["git", "add", "-A"], cwd=repo)
+                cm = run(["git", "commit", "-m", f"{task_id}: implement"], cwd=repo)
+                unpushed_commits += cm.returncode == 0
+                commit_log = log_dir / task_id / "gitcommit.txt"
+                commit_log.parent.mkdir(parents=True, exist_ok=True)
+                commit_log.write_text(cm.stdout + "\n" + cm.stderr, encoding="utf-8")
+
+            handoff.close()
+            done_ids[task_id] = None
+            task_digests[task_id] = spec_digest
+            persist_state()
+            state_writer.flush()
+            log(f"[{idx}/{total}] DONE {task_id}", "DONE")
+
+            if args.pause_after_task:
+                pause_file.touch(exist_ok=True)
+                wait_if_paused(pause_file, stop_file, interval_s=args.pause_check_interval, where=f"after task {task_id}")
+
+        log("All tasks completed.", "DONE")
+        return 0
+    finally:
+        if handoff is not None:
+            handoff.close()
+        if unpushed_commits:
+            log(f"Pushing {unpushed_commits} commit(s) to origin", "GIT")
+            run(["git", "push", "origin"], cwd=repo)
+        state_writer.close()
 
 
 if __name__ == "__main__":
@@ -3,7 +3,8 @@
 agentflow.py — Orchestrate Codex / Claude Code / Gemini CLI to implement tasks from a CSV.
 
 Key features:
-- Runs tasks sequentially from a CSV.
+- Runs tasks sequentially from a CSV (agents edit one shared working tree, and
+  each handoff records its git status, so tasks are never run concurrently).
 - After-prompts: run N extra prompts after each task (from file or CLI).
 - Engine options: codex (default), claude, gemini with fallback chain.
 - Cross-engine resume via a per-task handoff file (.agentflow/handoff/<task_id>.md)
@@ -27,23 +28,33 @@ Docs:
 from __future__ import annotations
 
 import argparse
+import codecs
 import csv
 import dataclasses
 import datetime as _dt
+import functools
+import io
+import itertools
 import json
 import os
-import platform
 import re
+import select
 import shutil
 import signal
 import subprocess
 import sys
 import textwrap
+import threading
 import time
+from collections import deque
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Sequence, Tuple
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
 
+try:  # optional: faster JSON for state.json and agent output parsing
+    import orjson
+except ImportError:  # pragma: no cover - depends on environment
+    orjson = None
 
 APP_DIRNAME = ".agentflow"
 DEFAULT_STATE_FILE = "state.json"
@@ -76,7 +87,7 @@ class RunResult:
     error_summary: Optional[str] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class Cursor:
     task_index: int = 0
     phase: str = "main"  # "main" or "after"
@@ -95,7 +106,10 @@ def ensure_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
 
+@functools.lru_cache(maxsize=None)
 def which(binary: str) -> Optional[str]:
+    # Resolved once per binary: PATH does not change while agentflow runs, and
+    # every engine step and git call would otherwise rescan it.
     return shutil.which(binary)
 
 
@@ -108,10 +122,15 @@ def write_text(path: Path, text: str) -> None:
     path.write_text(text, encoding="utf-8")
 
 
-def append_text(path: Path, text: str) -> None:
-    ensure_dir(path.parent)
-    with path.open("a", encoding="utf-8") as f:
-        f.write(text)
+def json_loads(text: str) -> Any:
+    return orjson.loads(text) if orjson is not None else json.loads(text)
+
+
+def json_dumps_compact(obj: Any) -> bytes:
+    """Compact UTF-8 JSON (non-ASCII kept as-is)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
 
 def clamp(s: str, max_chars: int) -> str:
@@ -120,6 +139,7 @@ def clamp(s: str, max_chars: int) -> str:
     return s[: max_chars - 1] + "…"
 
 
+@functools.lru_cache(maxsize=32)
 def normalize_engine(name: str) -> str:
     name = name.strip().lower()
     if name in {"codex", "openai", "oai"}:
@@ -139,7 +159,7 @@ def split_csv_list(s: str) -> List[str]:
 def git(cmd: Sequence[str], cwd: Path) -> Tuple[int, str]:
     try:
         p = subprocess.run(
-            ["git", *cmd],
+            [which("git") or "git", *cmd],
             cwd=str(cwd),
             text=True,
             stdout=subprocess.PIPE,
@@ -155,21 +175,106 @@ def git(cmd: Sequence[str], cwd: Path) -> Tuple[int, str]:
 # Pause / stop controls
 # -------------------------
 
+class _InotifyWatcher:
+    """Wakes on entries created/removed in a directory (optional inotify_simple)."""
+
+    def __init__(self, inotify_simple: Any, directory: Path):
+        flags = inotify_simple.flags
+        self._ino = inotify_simple.INotify()
+        try:
+            self._ino.add_watch(str(directory), flags.CREATE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO)
+        except OSError:
+            self._ino.close()
+            raise
+
+    def wait(self, timeout_s: float) -> None:
+        self._ino.read(timeout=int(timeout_s * 1000))
+
+    def close(self) -> None:
+        self._ino.close()
+
+
+class _KqueueWatcher:
+    """Wakes on writes to a directory, i.e. entries added or removed (BSD/macOS)."""
+
+    def __init__(self, directory: Path):
+        self._fd = os.open(str(directory), os.O_RDONLY)
+        self._kq = select.kqueue()
+        try:
+            self._kq.control([select.kevent(
+                self._fd,
+                filter=select.KQ_FILTER_VNODE,
+                flags=select.KQ_EV_ADD | select.KQ_EV_CLEAR,
+                fflags=select.KQ_NOTE_WRITE | select.KQ_NOTE_DELETE | select.KQ_NOTE_RENAME,
+            )], 0)
+        except OSError:
+            self.close()
+            raise
+
+    def wait(self, timeout_s: float) -> None:
+        self._kq.control(None, 1, timeout_s)
+
+    def close(self) -> None:
+        self._kq.close()
+        os.close(self._fd)
+
+
+def open_dir_watcher(directory: Path) -> Optional[Any]:
+    """A watcher whose wait(timeout_s) returns early when directory changes, or None."""
+    try:
+        try:
+            import inotify_simple
+        except ImportError:
+            inotify_simple = None
+        if inotify_simple is not None:
+            return _InotifyWatcher(inotify_simple, directory)
+        if hasattr(select, "kqueue"):
+            return _KqueueWatcher(directory)
+    except OSError:
+        pass
+    return None
+
+
 class ControlFiles:
+    """
+    PAUSE/STOP files in the app dir. They are only consulted between steps, so
+    a stat per check is all a stop needs; a watcher is used only while paused.
+    """
+
     def __init__(self, app_dir: Path):
         self.pause_path = app_dir / PAUSE_FILE
         self.stop_path = app_dir / STOP_FILE
+        self._pause_requested = False
+
+    def request_pause(self) -> None:
+        # Signal-safe: only sets a flag; PAUSE is written at the next check.
+        self._pause_requested = True
 
     def should_pause(self) -> bool:
+        if self._pause_requested:
+            self._pause_requested = False
+            write_text(self.pause_path, "paused\n")
         return self.pause_path.exists()
 
     def should_stop(self) -> bool:
         return self.stop_path.exists()
 
     def wait_if_paused(self) -> None:
-        while self.should_pause():
-            print(f"[agentflow] PAUSED (delete {self.pause_path} to continue)...")
-            time.sleep(2.0)
+        if not self.should_pause():
+            return
+        # Block on a directory watch so deleting PAUSE resumes at once; the
+        # 2s timeout keeps the PAUSED reminder (and is the polling fallback).
+        watcher = open_dir_watcher(self.pause_path.parent)
+        try:
+            while self.should_pause():
+                print(f"[agentflow] PAUSED (delete {self.pause_path} to continue)...")
+                if watcher is not None:
+                    watcher.wait(2.0)
+                else:
+                    time.sleep(2.0)
+        finally:
+            if watcher is not None:
+                watcher.close()
 
 
 # -------------------------
@@ -230,61 +335,93 @@ def next_task_id(task_id: str) -> str:
     return dataclasses.replace(parsed, task_num=parsed.task_num + 1).format()
 
 
-def apply_placeholders(text: str, task_id: str) -> str:
-    return (
-        text.replace("{TASK_ID}", task_id)
-        .replace("{TASK_ID_NEXT}", next_task_id(task_id))
-    )
+_PLACEHOLDER_RE = re.compile(r"\{TASK_ID(_NEXT)?\}")
+
+
+def apply_placeholders(text: str, task_id: str, task_id_next: str) -> str:
+    # One pass for both placeholders; callers compute task_id_next once per task.
+    return _PLACEHOLDER_RE.sub(lambda m: task_id_next if m.group(1) else task_id, text)
 
 
 # -------------------------
 # CSV parsing
 # -------------------------
 
-def detect_column(fieldnames: Sequence[str], candidates: Sequence[str]) -> Optional[str]:
-    lowered = {f.lower(): f for f in fieldnames}
-    for c in candidates:
-        if c.lower() in lowered:
-            return lowered[c.lower()]
-    return None
-
-
-def load_tasks_from_csv(path: Path) -> List[Task]:
+def detect_column(lowered: Dict[str, str], candidates: Sequence[str]) -> Optional[str]:
+    """First candidate present in lowered ({lowercased header: header})."""
+    return next((lowered[c] for c in map(str.lower, candidates) if c in lowered), None)
+
+
+def _row_dict(fieldnames: Sequence[str], row: List[str]) -> Dict[Optional[str], Any]:
+    """The row as csv.DictReader would build it (None fills / extras key)."""
+    d: Dict[Optional[str], Any] = dict(zip(fieldnames, row))
+    if len(row) < len(fieldnames):
+        for key in fieldnames[len(row):]:
+            d[key] = None
+    elif len(row) > len(fieldnames):
+        d[None] = row[len(fieldnames):]
+    return d
+
+
+def iter_tasks_from_csv(path: Path) -> Iterator[Task]:
+    # Rows are read lazily so the first task starts without parsing the whole
+    # CSV; the cursor's task_index is the row position within this stream.
+    # Parsing stays sequential: quoted specs may span lines, so the file can't
+    # be split at arbitrary newlines, and a task is parsed long before it runs.
+    # Plain csv.reader rows with the columns resolved to indexes once: no dict
+    # per row (only rows without a spec, whose fallback spec is the row dict).
     with path.open("r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
-        if reader.fieldnames is None:
+        # The file is read front to back exactly once; let the kernel read ahead.
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
             raise ValueError("CSV has no header row.")
 
-        fieldnames = list(reader.fieldnames)
+        fieldnames = list(header)
+
+        lowered = {f.lower(): f for f in fieldnames}
+        positions = {name: i for i, name in enumerate(fieldnames)}  # last wins, like DictReader
+        id_col = detect_column(lowered, ["task_id", "id", "task id", "task"])
+        title_col = detect_column(lowered, ["title", "name", "summary"])
+        spec_col = detect_column(lowered, ["spec", "prompt", "details", "description", "body"])
+        engine_col = detect_column(lowered, ["engine", "model", "agent"])
+        # Missing columns map past the header, so they read as empty below
+        missing = len(fieldnames)
+        id_idx, title_idx, spec_idx, engine_idx = (
+            positions[c] if c is not None else missing for c in (id_col, title_col, spec_col, engine_col)
+        )
 
-        id_col = detect_column(fieldnames, ["task_id", "id", "task id", "task"])
-        title_col = detect_column(fieldnames, ["title", "name", "summary"])
-        spec_col = detect_column(fieldnames, ["spec", "prompt", "details", "description", "body"])
-        engine_col = detect_column(fieldnames, ["engine", "model", "agent"])
+        i = 0
+        for row in reader:
+            if not row:
+                continue  # DictReader skips blank lines too
+            n = min(len(row), missing)  # extra cells belong to no column
 
-        tasks: List[Task] = []
-        for i, row in enumerate(reader):
-            raw_id = (row.get(id_col) if id_col else "") or ""
-            task_id = raw_id.strip() if raw_id.strip() else f"row{i+1}"
+            raw_id = row[id_idx].strip() if id_idx < n else ""
+            task_id = raw_id if raw_id else f"row{i+1}"
 
-            title = ((row.get(title_col) if title_col else "") or "").strip()
+            title = row[title_idx].strip() if title_idx < n else ""
 
-            spec = ((row.get(spec_col) if spec_col else "") or "").strip()
+            spec = row[spec_idx].strip() if spec_idx < n else ""
             if not spec:
-                spec = json.dumps(row, ensure_ascii=False, indent=2)
+                spec = json.dumps(_row_dict(fieldnames, row), ensure_ascii=False, indent=2)
+
+            engine = (row[engine_idx].strip() if engine_idx < n else "") or None
 
-            engine = ((row.get(engine_col) if engine_col else "") or "").strip() or None
+            yield Task(task_id=task_id, title=title, spec=spec, engine=engine)
+            i += 1
 
-            tasks.append(Task(task_id=task_id, title=title, spec=spec, engine=engine))
 
-    return tasks
+_BLANK_LINE_RE = re.compile(r"\n\s*\n")
 
 
 def load_after_prompts(after_file: Optional[Path], after_list: List[str]) -> List[str]:
     prompts: List[str] = []
     if after_file:
         raw = read_text(after_file)
-        blocks = [b.strip() for b in re.split(r"\n\s*\n", raw) if b.strip()]
+        blocks = [b.strip() for b in _BLANK_LINE_RE.split(raw) if b.strip()]
         prompts.extend(blocks)
     prompts.extend([p.strip() for p in after_list if p.strip()])
     return prompts
@@ -295,21 +432,121 @@ def load_after_prompts(after_file: Optional[Path], after_list: List[str]) -> Lis
 # -------------------------
 
 def load_state(path: Path) -> Dict[str, Any]:
-    if not path.exists():
+    # state.json stays JSON (compact), not a binary snapshot.
+    try:
+        text = read_text(path)
+    except FileNotFoundError:
         return {"cursor": dataclasses.asdict(Cursor()), "tasks": {}}
     try:
-        return json.loads(read_text(path))
+        return json_loads(text)
     except Exception:
         backup = path.with_suffix(".corrupt." + now_stamp() + ".json")
         shutil.copy2(path, backup)
         return {"cursor": dataclasses.asdict(Cursor()), "tasks": {}}
 
 
-def save_state(path: Path, state: Dict[str, Any]) -> None:
-    ensure_dir(path.parent)
-    tmp = path.with_suffix(".tmp")
-    tmp.write_text(json.dumps(state, indent=2, ensure_ascii=False), encoding="utf-8")
-    tmp.replace(path)
+# Per state file: (seq, bytes, fsynced) of the last write. Snapshots are
+# numbered when encoded, so an older one finishing late never overwrites a
+# newer one, and saves that would write the same bytes again are skipped.
+_saved_state: Dict[Path, Tuple[int, bytes, bool]] = {}
+_state_lock = threading.Lock()
+
+# Durable saves only need the data (and size) on disk, not the inode times;
+# fdatasync is not available everywhere (e.g. macOS), fsync is the fallback.
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+_state_seq = itertools.count()
+
+
+def save_state(path: Path, state: Dict[str, Any], *, durable: bool = False) -> None:
+    # Compact JSON: the state (with every task's history) is rewritten after
+    # each step, and indentation roughly doubled the bytes written.
+    _write_state(path, json_dumps_compact(state), next(_state_seq), durable=durable)
+
+
+def _sync_file(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        _fdatasync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_state(path: Path, data: bytes, seq: int, *, durable: bool) -> None:
+    with _state_lock:
+        saved = _saved_state.get(path)
+        if saved is not None and seq < saved[0]:
+            if durable and not saved[2]:
+                # A newer per-step save got there first; make what it wrote
+                # durable instead, so the checkpoint is not lost.
+                _sync_file(path)
+                _saved_state[path] = (saved[0], saved[1], True)
+            return
+        if saved is not None and saved[1] == data:
+            if durable and not saved[2]:
+                # Already on disk from a per-step save; just make it durable.
+                _sync_file(path)
+            _saved_state[path] = (seq, data, saved[2] or durable)
+            return
+        ensure_dir(path.parent)
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+            if durable:
+                # Only at task boundaries; per-step saves skip the fsync stall.
+                f.flush()
+                _fdatasync(f.fileno())
+        tmp.replace(path)
+        _saved_state[path] = (seq, data, durable)
+
+
+class StateCheckpointer(threading.Thread):
+    """
+    Writes durable (fsynced) state checkpoints on a background thread, so the
+    next task starts without waiting on the disk. submit() encodes the state
+    right away, so the caller may keep mutating it; a checkpoint still pending
+    when a newer one arrives is dropped. A failed write is reported and kept,
+    and close() retries it on the calling thread, raising if it fails again.
+    """
+
+    def __init__(self, path: Path):
+        super().__init__(name="state-checkpointer", daemon=True)
+        self.path = path
+        self._cond = threading.Condition()
+        self._pending: Optional[Tuple[bytes, int]] = None
+        self._failed: Optional[Tuple[bytes, int]] = None
+        self._closing = False
+
+    def submit(self, state: Dict[str, Any]) -> None:
+        item = (json_dumps_compact(state), next(_state_seq))
+        with self._cond:
+            self._pending = item
+            self._cond.notify()
+
+    def run(self) -> None:
+        while True:
+            with self._cond:
+                while self._pending is None and not self._closing:
+                    self._cond.wait()
+                item, self._pending = self._pending, None
+            if item is None:
+                return
+            try:
+                _write_state(self.path, *item, durable=True)
+            except Exception as e:
+                print(f"[agentflow] WARNING: could not write state checkpoint {self.path}: {e}")
+                self._failed = item
+            else:
+                self._failed = None
+
+    def close(self) -> None:
+        """Write any pending checkpoint and stop the thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self.join()
+        if self._failed is not None:
+            item, self._failed = self._failed, None
+            _write_state(self.path, *item, durable=True)
 
 
 def get_cursor(state: Dict[str, Any]) -> Cursor:
@@ -325,6 +562,12 @@ def set_cursor(state: Dict[str, Any], cursor: Cursor) -> None:
     state["cursor"] = dataclasses.asdict(cursor)
 
 
+def history_log_ref(log_path: Optional[Path], app_dir: Path) -> Optional[str]:
+    # History logs live under the app dir, next to state.json; storing them
+    # relative to it keeps the (rewritten every step) state file small.
+    return os.path.relpath(log_path, app_dir) if log_path else None
+
+
 def ensure_task_state(state: Dict[str, Any], task_id: str) -> Dict[str, Any]:
     tasks = state.setdefault("tasks", {})
     tstate = tasks.setdefault(task_id, {})
@@ -350,77 +593,181 @@ def run_process(
 ) -> Tuple[int, str]:
     ensure_dir(log_path.parent)
 
-    header = f"$ {' '.join(cmd)}\n\n"
-    write_text(log_path, header)
-
-    merged_env = os.environ.copy()
+    # Inherit the environment directly unless there are overrides to merge.
+    merged_env: Optional[Dict[str, str]] = None
     if env:
-        merged_env.update(env)
+        merged_env = {**os.environ, **env}
 
-    try:
-        p = subprocess.Popen(
-            list(cmd),
-            cwd=str(cwd),
-            stdin=subprocess.PIPE if stdin_text is not None else None,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            env=merged_env,
-            bufsize=1,
-        )
-    except FileNotFoundError:
-        append_text(log_path, f"\n[agentflow] ERROR: command not found: {cmd[0]}\n")
-        return 127, ""
+    # One buffered handle for the whole run; reopening the log per output line
+    # dominated run_process on verbose agents.
+    with open(log_path, "w", encoding="utf-8", buffering=65536) as log_fh:
+        log_fh.write(f"$ {' '.join(cmd)}\n\n")
 
-    if stdin_text is not None and p.stdin:
         try:
-            p.stdin.write(stdin_text)
-            p.stdin.close()
-        except BrokenPipeError:
-            pass
-
-    captured: List[str] = []
-    captured_chars = 0
-
-    assert p.stdout is not None
-    for line in p.stdout:
-        append_text(log_path, line)
-        if verbose:
-            sys.stdout.write(line)
-            sys.stdout.flush()
-        captured.append(line)
-        captured_chars += len(line)
-        if captured_chars > _MAX_CAPTURE_CHARS:
-            drop = max(1, len(captured) // 10)
-            captured = captured[drop:]
-            captured_chars = sum(len(x) for x in captured)
+            p = subprocess.Popen(
+                list(cmd),
+                cwd=str(cwd),
+                stdin=subprocess.PIPE if stdin_text is not None else None,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                env=merged_env,
+                bufsize=0,
+            )
+        except FileNotFoundError:
+            log_fh.write(f"\n[agentflow] ERROR: command not found: {cmd[0]}\n")
+            return 127, ""
+
+        if stdin_text is not None and p.stdin:
+            try:
+                p.stdin.write(stdin_text.encode("utf-8"))
+                p.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        # Output is read as raw chunks of whatever the pipe holds (up to 64 KiB)
+        # and decoded once per chunk, rather than decoded line by line in text
+        # mode. The decoder carries split UTF-8 sequences across chunks and
+        # translates newlines like text mode did.
+        decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")("replace"), translate=True)
+
+        # Rolling tail bounded by characters only: a deque maxlen would evict
+        # chunks without updating captured_chars. Old chunks are dropped only
+        # while the rest still fills the budget, so the kept tail is never
+        # shorter than _MAX_CAPTURE_CHARS.
+        captured: Deque[str] = deque()
+        captured_chars = 0
+
+        assert p.stdout is not None
+        while True:
+            chunk = p.stdout.read(65536)
+            text = decoder.decode(chunk, final=not chunk)
+            if text:
+                log_fh.write(text)
+                if verbose:
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+                captured.append(text)
+                captured_chars += len(text)
+                while captured_chars - len(captured[0]) >= _MAX_CAPTURE_CHARS:
+                    captured_chars -= len(captured.popleft())
+            if not chunk:
+                break
 
     rc = p.wait()
     out = "".join(captured)
     return rc, out
 
 
+def _matching_open_brace(text: str) -> int:
+    """Index of the { that balances the final } of text, scanning backwards; -1 if none."""
+    depth = 0
+    in_string = False
+    for i in range(len(text) - 1, -1, -1):
+        ch = text[i]
+        if ch == '"':
+            backslashes = 0
+            while i - backslashes > 0 and text[i - backslashes - 1] == "\\":
+                backslashes += 1
+            if backslashes % 2 == 0:
+                in_string = not in_string
+        elif in_string:
+            continue
+        elif ch == "}":
+            depth += 1
+        elif ch == "{":
+            depth -= 1
+            if depth == 0:
+                return i
+    return -1
+
+
 def try_parse_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """Parse the top-level {...} object that ends text (one forward pass).
+
+    Log noise before the object (a stray "{" or quote) can throw the forward
+    pass off; then the object is matched backwards from the final } and, as a
+    last resort, the suffix from the last { is tried.
+    """
     text = text.strip()
     if not text:
         return None
-    for i in range(len(text) - 1, -1, -1):
-        if text[i] == "{":
-            candidate = text[i:]
-            try:
-                return json.loads(candidate)
-            except Exception:
-                continue
-    try:
-        return json.loads(text)
-    except Exception:
-        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    start = -1
+    span: Optional[Tuple[int, int]] = None
+    for i, ch in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = depth > 0
+        elif ch == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == "}" and depth > 0:
+            depth -= 1
+            if depth == 0:
+                span = (start, i + 1)
+
+    if start == -1:
+        try:
+            return json_loads(text)
+        except Exception:
+            return None
+
+    candidates: List[int] = []
+    if span is not None and span[1] == len(text):
+        candidates.append(span[0])
+    if text.endswith("}"):
+        candidates.append(_matching_open_brace(text))
+    candidates.append(text.rfind("{"))
+    for begin in dict.fromkeys(candidates):
+        if begin < 0:
+            continue
+        try:
+            return json_loads(text[begin:])
+        except Exception:
+            continue
+    return None
 
 
 # -------------------------
 # Engines
 # -------------------------
 
+# Error text that means the provider throttled the request
+_RATE_LIMIT_RE = re.compile(r"\b429\b|rate[ _-]?limit|RESOURCE_EXHAUSTED|quota exceeded", re.IGNORECASE)
+# Lines of CLI output the provider reports errors on ("ERROR: ...",
+# "[API Error: ...]", JSON error events); the rest is transcript, where the
+# agent may well quote "429" or "rate limit" from the code it works on.
+_ERROR_LINE_RE = re.compile(
+    r'^\s*(?:\[?(?:api\s+)?error\b|\{.*"(?:type"\s*:\s*"error|error"\s*:\s*[{"])).*$',
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def is_rate_limited(result: RunResult) -> bool:
+    """True if the error summary or a provider error line reports throttling."""
+    if result.error_summary and _RATE_LIMIT_RE.search(result.error_summary):
+        return True
+    return any(_RATE_LIMIT_RE.search(m.group(0)) for m in _ERROR_LINE_RE.finditer(result.stdout[-4000:]))
+
+_THROTTLE_MIN_S = 30.0
+_THROTTLE_MAX_S = 600.0
+# How often a throttle wait checks the PAUSE/STOP files
+_THROTTLE_POLL_S = 1.0
+
+# gemini reports a bad --resume token in the error at the end of its output
+_GEMINI_ERROR_TAIL_CHARS = 4096
+
+
 class Engine:
     def __init__(
         self,
@@ -441,14 +788,58 @@ class Engine:
         self.verbose = verbose
         self.gemini_resume = gemini_resume
         self.claude_allowed_tools = claude_allowed_tools
+        # Per-engine throttle backoff: doubles on each rate-limited run, and
+        # halves on each successful one
+        self._backoff_s: Dict[str, float] = {}
+        self._not_before: Dict[str, float] = {}
+
+    # ----- Rate-limit gating -----
+
+    def usable_engines(self, engines: Sequence[str]) -> List[str]:
+        """
+        The engines to try for a step, in order: those not in backoff, or, when
+        every engine is throttled, all of them, soonest available first.
+        """
+        now = time.monotonic()
+        ready = [e for e in engines if self._not_before.get(e, 0.0) <= now]
+        if ready:
+            return ready
+        return sorted(engines, key=lambda e: self._not_before.get(e, 0.0))
+
+    def wait_for_slot(self, engine: str, controls: ControlFiles) -> bool:
+        """
+        Wait until a throttled engine's backoff has passed, honouring PAUSE.
+        Returns False if STOP appears meanwhile.
+        """
+        delay = self._not_before.get(engine, 0.0) - time.monotonic()
+        if delay > 0:
+            print(f"[agentflow] {engine} was rate-limited; waiting {delay:.0f}s before using it again.")
+        while delay > 0:
+            controls.wait_if_paused()
+            if controls.should_stop():
+                return False
+            time.sleep(min(delay, _THROTTLE_POLL_S))
+            delay = self._not_before.get(engine, 0.0) - time.monotonic()
+        return True
+
+    def record_result(self, result: RunResult) -> None:
+        engine = result.engine
+        if result.ok:
+            backoff = self._backoff_s.get(engine, 0.0) / 2
+            self._backoff_s[engine] = backoff if backoff >= _THROTTLE_MIN_S else 0.0
+        elif is_rate_limited(result):
+            backoff = min(max(self._backoff_s.get(engine, 0.0) * 2, _THROTTLE_MIN_S), _THROTTLE_MAX_S)
+            self._backoff_s[engine] = backoff
+            self._not_before[engine] = time.monotonic() + backoff
 
     # ----- Codex -----
 
     def run_codex(self, prompt: str, *, resume_last: bool, log_path: Path, last_path: Path) -> RunResult:
-        if not which("codex"):
+        binary = which("codex")
+        if not binary:
             return RunResult("codex", False, 127, "", "", error_summary="codex binary not found on PATH")
 
-        cmd: List[str] = ["codex", "exec"]
+        cmd: List[str] = [binary, "exec"]
 
         cmd += ["--cd", str(self.repo)]
         for d in self.include_dirs:
@@ -471,7 +862,13 @@ class Engine:
 
         rc, out = run_process(cmd, self.repo, log_path, stdin_text=prompt, verbose=self.verbose)
 
-        assistant_text = read_text(last_path).strip() if last_path.exists() else out.strip()
+        # codex writes the final message to last_path itself; its stdout holds the
+        # whole transcript, so the message cannot be cut from the stream. Read
+        # it with a single open instead of an exists() check first.
+        try:
+            assistant_text = read_text(last_path).strip()
+        except FileNotFoundError:
+            assistant_text = out.strip()
 
         return RunResult(
             engine="codex",
@@ -486,10 +883,11 @@ class Engine:
     # ----- Claude -----
 
     def run_claude(self, prompt: str, *, resume_session: Optional[str], log_path: Path) -> RunResult:
-        if not which("claude"):
+        binary = which("claude")
+        if not binary:
             return RunResult("claude", False, 127, "", "", error_summary="claude binary not found on PATH")
 
-        cmd: List[str] = ["claude", "-p", "--output-format", "json"]
+        cmd: List[str] = [binary, "-p", "--output-format", "json"]
 
         if self.models.get("claude"):
             cmd += ["--model", self.models["claude"]]
@@ -539,10 +937,11 @@ class Engine:
     # ----- Gemini -----
 
     def run_gemini(self, prompt: str, *, log_path: Path, resume_token: Optional[str]) -> RunResult:
-        if not which("gemini"):
+        binary = which("gemini")
+        if not binary:
             return RunResult("gemini", False, 127, "", "", error_summary="gemini binary not found on PATH")
 
-        cmd: List[str] = ["gemini", "--output-format", "json"]
+        cmd: List[str] = [binary, "--output-format", "json"]
 
         if self.models.get("gemini"):
             cmd += ["--model", self.models["gemini"]]
@@ -589,46 +988,94 @@ class Engine:
 # Prompt building
 # -------------------------
 
-def build_main_prompt(task: Task, *, handoff_path: Path) -> str:
-    title = f" — {task.title}" if task.title else ""
-    return textwrap.dedent(
-        f"""\
-        You are an autonomous coding agent working inside this repository.
+# Templates are dedented once here and filled with str.format, so multi-line
+# values (specs, agent messages, git status) no longer defeat the dedent.
+_MAIN_PROMPT_TPL = textwrap.dedent(
+    """\
+    You are an autonomous coding agent working inside this repository.
 
-        TASK: {task.task_id}{title}
+    TASK: {task_id}{title}
 
-        Instructions:
-        - First read the latest handoff file if it exists: {handoff_path}
-        - Implement the task described below in the codebase.
-        - Run relevant tests / lint / typechecks if available and fix failures.
-        - Keep changes minimal, high-quality, and consistent with the existing style.
-        - If you can't fully complete, leave clear TODOs and explain what's blocked.
+    Instructions:
+    - First read the latest handoff file if it exists: {handoff_path}
+    - Implement the task described below in the codebase.
+    - Run relevant tests / lint / typechecks if available and fix failures.
+    - Keep changes minimal, high-quality, and consistent with the existing style.
+    - If you can't fully complete, leave clear TODOs and explain what's blocked.
 
-        Task spec:
-        {task.spec}
-        """
-    ).strip() + "\n"
+    Task spec:
+    {spec}
+    """
+)
 
+_AFTER_PROMPT_TPL = textwrap.dedent(
+    """\
+    Follow-up for TASK {task_id}
 
-def build_after_prompt(after_prompt: str, *, task_id: str, handoff_path: Path) -> str:
-    after_prompt = apply_placeholders(after_prompt, task_id)
-    return textwrap.dedent(
-        f"""\
-        Follow-up for TASK {task_id}
+    Context:
+    - Read the current handoff: {handoff_path}
 
-        Context:
-        - Read the current handoff: {handoff_path}
+    Follow-up instructions:
+    {after_prompt}
+    """
+)
 
-        Follow-up instructions:
-        {after_prompt}
-        """
+
+def build_main_prompt(task: Task, *, handoff_path: Path) -> str:
+    title = f" — {task.title}" if task.title else ""
+    return _MAIN_PROMPT_TPL.format(
+        task_id=task.task_id, title=title, handoff_path=handoff_path, spec=task.spec
     ).strip() + "\n"
 
 
+def build_after_prompt(after_prompt: str, *, task_id: str, task_id_next: str, handoff_path: Path) -> str:
+    after_prompt = apply_placeholders(after_prompt, task_id, task_id_next)
+    return _AFTER_PROMPT_TPL.format(
+        task_id=task_id, handoff_path=handoff_path, after_prompt=after_prompt
+    ).strip() + "\n"
+
+
+def build_batched_after_prompt(after_prompts: Sequence[str], *, task_id: str, task_id_next: str, handoff_path: Path) -> str:
+    lines = [
+        f"Follow-up for TASK {task_id}",
+        "",
+        "Context:",
+        f"- Read the current handoff: {handoff_path}",
+        "",
+        f"Follow-up instructions ({len(after_prompts)} steps). Complete each step fully, in order, before starting the next:",
+    ]
+    for n, ap in enumerate(after_prompts, start=1):
+        lines += ["", f"{n}. " + apply_placeholders(ap, task_id, task_id_next)]
+    return "\n".join(lines).strip() + "\n"
+
+
 # -------------------------
 # Handoff writing
 # -------------------------
 
+_HANDOFF_TPL = textwrap.dedent(
+    """\
+    # Handoff — {task_id}
+
+    - Title: {title}
+    - Phase: {phase}
+    - Engine: {engine}
+    - Status: {status} (exit={exit_code})
+    - Log: {log}
+    - Updated: {updated}
+
+    ## Latest agent message (truncated)
+    {message}
+
+    ## Git status (porcelain)
+    {git_status}
+
+    ## Git diff --stat
+    {diffstat}
+    """
+)
+
+
 def write_handoff(
     handoff_path: Path,
     *,
@@ -641,29 +1088,25 @@ def write_handoff(
     assistant_text: str,
     repo: Path,
 ) -> None:
-    _, status = git(["status", "--porcelain=v1"], cwd=repo)
-    _, diffstat = git(["diff", "--stat"], cwd=repo)
-
-    body = textwrap.dedent(
-        f"""\
-        # Handoff — {task.task_id}
-
-        - Title: {task.title or "(none)"}
-        - Phase: {phase}
-        - Engine: {engine}
-        - Status: {"✅ success" if ok else "❌ failed"} (exit={exit_code})
-        - Log: {log_path if log_path else "(none)"}
-        - Updated: { _dt.datetime.now().isoformat(timespec="seconds") }
-
-        ## Latest agent message (truncated)
-        {clamp(assistant_text.strip(), 4000)}
-
-        ## Git status (porcelain)
-        {status.strip() or "(clean)"}
-
-        ## Git diff --stat
-        {diffstat.strip() or "(no diff)"}
-        """
+    rc, status = git(["status", "--porcelain=v1"], cwd=repo)
+    # `git diff --stat` only covers unstaged changes to tracked files, so when no
+    # status line has a worktree change (second column) skip the second git run.
+    diffstat = ""
+    if rc != 0 or any(len(ln) > 1 and ln[1] not in " ?!" for ln in status.splitlines()):
+        _, diffstat = git(["diff", "--stat"], cwd=repo)
+
+    body = _HANDOFF_TPL.format(
+        task_id=task.task_id,
+        title=task.title or "(none)",
+        phase=phase,
+        engine=engine,
+        status="✅ success" if ok else "❌ failed",
+        exit_code=exit_code,
+        log=log_path if log_path else "(none)",
+        updated=_dt.datetime.now().isoformat(timespec="seconds"),
+        message=clamp(assistant_text.strip(), 4000),
+        git_status=status.strip() or "(clean)",
+        diffstat=diffstat.strip() or "(no diff)",
     ).strip() + "\n"
     write_text(handoff_path, body)
 
@@ -680,13 +1123,14 @@ class KeepAwake:
     def __enter__(self) -> "KeepAwake":
         if not self.enabled:
             return self
-        if platform.system() != "Darwin":
+        if sys.platform != "darwin":
             print("[agentflow] --keep-awake is macOS-only; ignoring.")
             return self
-        if not which("caffeinate"):
+        binary = which("caffeinate")
+        if not binary:
             print("[agentflow] caffeinate not found; ignoring --keep-awake.")
             return self
-        self.proc = subprocess.Popen(["caffeinate", "-dimsu"])
+        self.proc = subprocess.Popen([binary, "-dimsu"])
         print("[agentflow] keep-awake enabled via caffeinate.")
         return self
 
@@ -710,24 +1154,26 @@ def run_task(
     *,
     app_dir: Path,
     after_prompts: List[str],
+    after_batch_size: int = 1,
     primary_engine: str,
-    fallback_engines: List[str],
+    fallback_engines: Sequence[str],
     state: Dict[str, Any],
     cursor: Cursor,
     controls: ControlFiles,
 ) -> Cursor:
     tstate = ensure_task_state(state, task.task_id)
 
+    # Both directories are created by the first write into them (run_process
+    # for logs, write_text for the handoff), not up front for every task.
     task_dir = app_dir / "tasks" / task.task_id
-    ensure_dir(task_dir)
-
     handoff_path = app_dir / "handoff" / f"{task.task_id}.md"
-    ensure_dir(handoff_path.parent)
 
     claude_session = tstate.get("claude_session_id")
     codex_can_resume = bool(tstate.get("codex_can_resume", False))
     gemini_resume = tstate.get("gemini_resume")
 
+    task_id_next = next_task_id(task.task_id)
+
     engine_order: List[str] = []
     row_engine = normalize_engine(task.engine) if task.engine else None
     if row_engine:
@@ -736,7 +1182,12 @@ def run_task(
         engine_order.append(primary_engine)
     engine_order.extend([e for e in fallback_engines if e not in engine_order])
 
-    def run_with_engine(engine_name: str, prompt: str, phase: str, step_name: str) -> RunResult:
+    # Steps are never answered from a cache: an engine run's real output is its
+    # edits to the working tree, which a stored RunResult cannot replay. Reruns
+    # skip finished steps through the state cursor (--resume) instead.
+    # Returns the attempt's timestamp with its result; the same stamp names the
+    # log files and the history entry.
+    def run_with_engine(engine_name: str, prompt: str, phase: str, step_name: str) -> Tuple[str, RunResult]:
         ts = now_stamp()
         log_path = task_dir / f"{ts}.{engine_name}.{phase}.{step_name}.log"
         last_path = task_dir / f"{ts}.{engine_name}.{phase}.{step_name}.last.txt"
@@ -744,23 +1195,26 @@ def run_task(
         print(f"\n[agentflow] {task.task_id} {phase}:{step_name} using {engine_name} ...")
 
         if engine_name == "codex":
-            return engine_runner.run_codex(
+            result = engine_runner.run_codex(
                 prompt,
                 resume_last=(phase == "after" and codex_can_resume),
                 log_path=log_path,
                 last_path=last_path,
             )
-        if engine_name == "claude":
-            return engine_runner.run_claude(
+        elif engine_name == "claude":
+            result = engine_runner.run_claude(
                 prompt,
                 resume_session=(claude_session if phase == "after" else None),
                 log_path=log_path,
             )
-        if engine_name == "gemini":
+        elif engine_name == "gemini":
             resume_token = gemini_resume or engine_runner.gemini_resume
-            return engine_runner.run_gemini(prompt, log_path=log_path, resume_token=resume_token)
+            result = engine_runner.run_gemini(prompt, log_path=log_path, resume_token=resume_token)
+        else:
+            raise ValueError(f"unsupported engine: {engine_name}")
 
-        raise ValueError(f"unsupported engine: {engine_name}")
+        engine_runner.record_result(result)
+        return ts, result
 
     # ---- MAIN phase ----
     if cursor.phase == "main":
@@ -772,8 +1226,12 @@ def run_task(
         prompt = build_main_prompt(task, handoff_path=handoff_path)
         result: Optional[RunResult] = None
 
-        for eng in engine_order:
-            result = run_with_engine(eng, prompt, "main", "run")
+        # Engines still in backoff are skipped while another one is free
+        for eng in engine_runner.usable_engines(engine_order):
+            if not engine_runner.wait_for_slot(eng, controls):
+                print("[agentflow] STOP file detected; exiting before starting next step.")
+                return cursor
+            ts, result = run_with_engine(eng, prompt, "main", "run")
             write_handoff(
                 handoff_path,
                 task=task,
@@ -788,12 +1246,12 @@ def run_task(
 
             tstate["history"].append(
                 {
-                    "ts": now_stamp(),
+                    "ts": ts,
                     "phase": "main",
                     "engine": eng,
                     "ok": result.ok,
                     "exit_code": result.exit_code,
-                    "log": str(result.log_path) if result.log_path else None,
+                    "log": history_log_ref(result.log_path, app_dir),
                 }
             )
 
@@ -804,7 +1262,7 @@ def run_task(
                 codex_can_resume = True
                 tstate["codex_can_resume"] = True
 
-            if eng == "gemini" and (not result.ok) and ("INVALID_ARGUMENT" in (result.stdout or "")):
+            if eng == "gemini" and (not result.ok) and ("INVALID_ARGUMENT" in (result.stdout or "")[-_GEMINI_ERROR_TAIL_CHARS:]):
                 tstate["gemini_resume"] = None
                 print("[agentflow] gemini resume appears invalid (INVALID_ARGUMENT). Disabled resume for this task.")
 
@@ -834,22 +1292,36 @@ def run_task(
             print("[agentflow] STOP file detected; exiting before starting next step.")
             return cursor
 
+        # Up to after_batch_size prompts share one engine call; 1 keeps the
+        # one-call-per-prompt behaviour.
         idx = cursor.after_index
-        ap = after_prompts[idx]
-        step_name = f"after{idx+1}"
-
-        prompt = build_after_prompt(ap, task_id=task.task_id, handoff_path=handoff_path)
+        batch = after_prompts[idx:idx + after_batch_size]
+        end = idx + len(batch)
+        if len(batch) == 1:
+            step_name = f"after{idx+1}"
+            phase_label = f"after[{idx+1}/{len(after_prompts)}]"
+            prompt = build_after_prompt(batch[0], task_id=task.task_id, task_id_next=task_id_next, handoff_path=handoff_path)
+        else:
+            step_name = f"after{idx+1}-{end}"
+            phase_label = f"after[{idx+1}..{end}/{len(after_prompts)}]"
+            prompt = build_batched_after_prompt(batch, task_id=task.task_id, task_id_next=task_id_next, handoff_path=handoff_path)
 
+        # Engines run one after another (they share the working tree), so try
+        # each at most once: when last_ok is the primary, a failing engine
+        # must not be rerun back-to-back before the fallbacks get a turn.
         last_ok = tstate.get("last_ok_engine") or primary_engine
-        after_engine_order = [last_ok, primary_engine] + [e for e in fallback_engines if e not in {last_ok, primary_engine}]
+        after_engine_order = list(dict.fromkeys([last_ok, primary_engine, *fallback_engines]))
 
         result = None
-        for eng in after_engine_order:
-            result = run_with_engine(eng, prompt, "after", step_name)
+        for eng in engine_runner.usable_engines(after_engine_order):
+            if not engine_runner.wait_for_slot(eng, controls):
+                print("[agentflow] STOP file detected; exiting before starting next step.")
+                return cursor
+            ts, result = run_with_engine(eng, prompt, "after", step_name)
             write_handoff(
                 handoff_path,
                 task=task,
-                phase=f"after[{idx+1}/{len(after_prompts)}]",
+                phase=phase_label,
                 engine=eng,
                 ok=result.ok,
                 exit_code=result.exit_code,
@@ -860,13 +1332,14 @@ def run_task(
 
             tstate["history"].append(
                 {
-                    "ts": now_stamp(),
+                    "ts": ts,
                     "phase": "after",
                     "after_index": idx,
+                    "after_count": len(batch),
                     "engine": eng,
                     "ok": result.ok,
                     "exit_code": result.exit_code,
-                    "log": str(result.log_path) if result.log_path else None,
+                    "log": history_log_ref(result.log_path, app_dir),
                 }
             )
 
@@ -877,7 +1350,7 @@ def run_task(
                 codex_can_resume = True
                 tstate["codex_can_resume"] = True
 
-            if eng == "gemini" and (not result.ok) and ("INVALID_ARGUMENT" in (result.stdout or "")):
+            if eng == "gemini" and (not result.ok) and ("INVALID_ARGUMENT" in (result.stdout or "")[-_GEMINI_ERROR_TAIL_CHARS:]):
                 tstate["gemini_resume"] = None
                 print("[agentflow] gemini resume appears invalid (INVALID_ARGUMENT). Disabled resume for this task.")
 
@@ -887,11 +1360,12 @@ def run_task(
 
         if result is None or not result.ok:
             tstate["status"] = "after_failed"
-            print(f"[agentflow] After prompt {idx+1} failed for task {task.task_id}. Continuing to next prompt.")
+            label = f"prompt {idx+1}" if len(batch) == 1 else f"prompts {idx+1}-{end}"
+            print(f"[agentflow] After {label} failed for task {task.task_id}. Continuing to next prompt.")
         else:
-            tstate["status"] = f"after_ok_{idx+1}"
+            tstate["status"] = f"after_ok_{end}"
 
-        cursor.after_index += 1
+        cursor.after_index = end
         set_cursor(state, cursor)
         save_state(engine_runner.app_dir / DEFAULT_STATE_FILE, state)
 
@@ -920,6 +1394,14 @@ def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
     p.add_argument("--include-dirs", default="", help="Extra dirs to include for agents (comma-separated).")
     p.add_argument("--after-file", default=None, help="File containing after-prompts (blank-line separated).")
     p.add_argument("--after", action="append", default=[], help="Add an after-prompt (repeatable).")
+    p.add_argument("--after-batch-size", type=int, default=1, help="Send up to K after-prompts per engine call (default: 1).")
+    p.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=1,
+        help="fsync state.json every N tasks (default: 1). It is still written after every step; a larger N\n"
+        "only widens what a power loss or OS crash can lose, not a crash of agentflow itself.",
+    )
     p.add_argument("--resume", action="store_true", help="Resume from .agentflow/state.json cursor if present.")
     p.add_argument("--start-task", default=None, help="Start from a specific task id (overrides --resume cursor).")
     p.add_argument("--verbose", action="store_true", help="Stream agent output to stdout as it runs.")
@@ -940,21 +1422,30 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         return 2
 
     app_dir = repo / APP_DIRNAME
-    ensure_dir(app_dir / "handoff")
-    ensure_dir(app_dir / "tasks")
 
     controls = ControlFiles(app_dir)
 
     primary_engine = normalize_engine(args.engine)
-    fallback_engines = [normalize_engine(x) for x in split_csv_list(args.fallback)]
-    fallback_engines = [e for e in fallback_engines if e != primary_engine]
+    fallback_engines = tuple(
+        dict.fromkeys(e for e in map(normalize_engine, split_csv_list(args.fallback)) if e != primary_engine)
+    )
 
-    include_dirs: List[Path] = []
-    if args.include_dirs.strip():
-        for d in split_csv_list(args.include_dirs):
-            include_dirs.append(Path(d).expanduser().resolve())
+    # Resolved once per run and de-duplicated (first occurrence wins): every
+    # engine call repeats these as flags, and gemini only takes the first five.
+    # os.path.realpath is what Path.resolve() runs, minus its extra stat() for
+    # symlink-loop detection.
+    include_dirs: List[Path] = [
+        Path(d)
+        for d in dict.fromkeys(os.path.realpath(os.path.expanduser(d)) for d in split_csv_list(args.include_dirs))
+    ]
 
     after_prompts = load_after_prompts(Path(args.after_file).expanduser().resolve() if args.after_file else None, args.after)
+    if args.after_batch_size < 1:
+        print("[agentflow] ERROR: --after-batch-size must be at least 1.")
+        return 2
+    if args.checkpoint_every < 1:
+        print("[agentflow] ERROR: --checkpoint-every must be at least 1.")
+        return 2
 
     models = {"codex": args.model_codex, "claude": args.model_claude, "gemini": args.model_gemini}
 
@@ -969,10 +1460,14 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         claude_allowed_tools=args.claude_allowed_tools,
     )
 
-    tasks = load_tasks_from_csv(tasks_path)
-    if not tasks:
+    # One pass over the CSV for the whole run: rows consumed while checking for
+    # an empty file or seeking --start-task are chained back in front.
+    task_rows: Iterator[Tuple[int, Task]] = enumerate(iter_tasks_from_csv(tasks_path))
+    first = next(task_rows, None)
+    if first is None:
         print("[agentflow] No tasks found in CSV.")
         return 0
+    task_rows = itertools.chain([first], task_rows)
 
     state_path = app_dir / DEFAULT_STATE_FILE
     state = load_state(state_path)
@@ -980,11 +1475,12 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
 
     if args.start_task:
         target = args.start_task.strip()
-        idx = next((i for i, t in enumerate(tasks) if t.task_id == target), None)
-        if idx is None:
+        found = next((row for row in task_rows if row[1].task_id == target), None)
+        if found is None:
             print(f"[agentflow] ERROR: start-task '{target}' not found in CSV.")
             return 2
-        cursor = Cursor(task_index=idx, phase="main", after_index=0)
+        task_rows = itertools.chain([found], task_rows)
+        cursor = Cursor(task_index=found[0], phase="main", after_index=0)
         set_cursor(state, cursor)
         save_state(state_path, state)
     elif not args.resume:
@@ -993,8 +1489,14 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         save_state(state_path, state)
 
     def _sigint_handler(sig, frame):
-        write_text(controls.pause_path, "paused\n")
-        print(f"\n[agentflow] SIGINT received => created {controls.pause_path}. Delete it to continue.\n")
+        # No file I/O or print() here: a handler that interrupts a buffered
+        # stdout write and prints again raises "reentrant call". The PAUSE file
+        # is created at the next pause check (before the next step).
+        controls.request_pause()
+        os.write(
+            sys.stdout.fileno(),
+            f"\n[agentflow] SIGINT received => pausing via {controls.pause_path} before the next step. Delete it to continue.\n\n".encode(),
+        )
 
     signal.signal(signal.SIGINT, _sigint_handler)
 
@@ -1003,7 +1505,7 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         f"  repo: {repo}\n"
         f"  tasks: {tasks_path}\n"
         f"  primary: {primary_engine}\n"
-        f"  fallback: {fallback_engines}\n"
+        f"  fallback: {list(fallback_engines)}\n"
         f"  autonomy: {args.autonomy}\n"
         f"  after_prompts: {len(after_prompts)}\n"
         f"  state: {state_path}\n"
@@ -1011,25 +1513,38 @@ def main(argv: Optional[Sequence[str]] = None) -> int:
         f"  stop: {controls.stop_path}\n"
     )
 
-    with KeepAwake(args.keep_awake):
-        while cursor.task_index < len(tasks):
-            task = tasks[cursor.task_index]
-            cursor = run_task(
-                engine_runner,
-                task,
-                app_dir=app_dir,
-                after_prompts=after_prompts,
-                primary_engine=primary_engine,
-                fallback_engines=fallback_engines,
-                state=state,
-                cursor=cursor,
-                controls=controls,
-            )
-            save_state(state_path, state)
-
-            if controls.should_stop():
-                print("[agentflow] STOP file detected; stopping.")
-                return 0
+    # Every task end is saved; only every Nth is fsynced (plus the final one).
+    checkpointer = StateCheckpointer(state_path)
+    checkpointer.start()
+    tasks_run = 0
+    try:
+        with KeepAwake(args.keep_awake):
+            for i, task in task_rows:
+                while cursor.task_index == i:
+                    cursor = run_task(
+                        engine_runner,
+                        task,
+                        app_dir=app_dir,
+                        after_prompts=after_prompts,
+                        after_batch_size=args.after_batch_size,
+                        primary_engine=primary_engine,
+                        fallback_engines=fallback_engines,
+                        state=state,
+                        cursor=cursor,
+                        controls=controls,
+                    )
+                    tasks_run += 1
+                    if tasks_run % args.checkpoint_every == 0:
+                        checkpointer.submit(state)
+                    else:
+                        save_state(state_path, state)
+
+                    if controls.should_stop():
+                        print("[agentflow] STOP file detected; stopping.")
+                        return 0
+    finally:
+        checkpointer.submit(state)
+        checkpointer.close()
 
     print("[agentflow] all tasks complete.")
     return 0
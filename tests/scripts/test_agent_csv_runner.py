@@ -0,0 +1,113 @@
+"""Tests for scripts/agent_csv_runner.py."""
+
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+SCRIPT = Path(__file__).resolve().parents[2] / "scripts" / "agent_csv_runner.py"
+
+
+@pytest.fixture(scope="module")
+def runner():
+    spec = importlib.util.spec_from_file_location("agent_csv_runner", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+# Stand-in codex CLI: answers `login status`, writes the last message and
+# edits ok.txt only when the prompt asks it to.
+FAKE_CODEX = """#!/bin/sh
+if [ "$1" = "login" ]; then echo "logged in"; exit 0; fi
+last=""; prev=""
+for a in "$@"; do [ "$prev" = "--output-last-message" ] && last="$a"; prev="$a"; done
+prompt=$(cat)
+case "$prompt" in *EDIT-TREE*) echo edited >> ok.txt ;; esac
+[ -n "$last" ] && echo done > "$last"
+exit 0
+"""
+
+
+def git(repo, *args):
+    subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+
+
+def run_runner(tmp_path, after_prompt, **config):
+    repo = tmp_path / "repo"
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    codex = bin_dir / "codex"
+    codex.write_text(FAKE_CODEX)
+    codex.chmod(0o755)
+
+    repo.mkdir()
+    git(repo, "init", "-q")
+    git(repo, "config", "user.email", "runner@example.com")
+    git(repo, "config", "user.name", "runner")
+    (repo / "ok.txt").write_text("ok\n")
+    git(repo, "add", ".")
+    git(repo, "commit", "-qm", "init")
+
+    (repo / ".t2" / "after_prompts").mkdir(parents=True)
+    (repo / ".t2" / "after_prompts" / "01.md").write_text(after_prompt)
+    (repo / ".t2" / "config.json").write_text(
+        json.dumps({"commands": {"test": "test -f ok.txt"}, "verify_after_prompts": True, **config})
+    )
+    (repo / "tasks.csv").write_text("id,title,spec\nT1-1,First,Do the first thing\n")
+
+    env = dict(os.environ, PATH=f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    return subprocess.run(
+        [sys.executable, str(SCRIPT), "--csv", "tasks.csv"],
+        cwd=repo,
+        env=env,
+        capture_output=True,
+        text=True,
+        timeout=60,
+    )
+
+
+def test_verify_after_prompts_skipped_when_after_prompts_leave_tree_unchanged(tmp_path):
+    proc = run_runner(tmp_path, "Review only, change nothing.\n")
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert "verify-after-prompts skipped (tree unchanged)" in proc.stdout
+
+
+def test_verify_after_prompts_runs_when_after_prompts_edit_tree(tmp_path):
+    proc = run_runner(tmp_path, "EDIT-TREE\n")
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+    assert "verify-after-prompts skipped" not in proc.stdout
+
+
+def test_unused_agent_config_is_not_read(tmp_path):
+    proc = run_runner(tmp_path, "Review only, change nothing.\n", claude={"max_turns": "many"})
+    assert proc.returncode == 0, proc.stdout + proc.stderr
+
+
+def test_state_writer_survives_failed_write(runner, tmp_path, monkeypatch):
+    real_write_json = runner.write_json
+    calls = []
+
+    def flaky_write_json(path, data):
+        calls.append(data)
+        if len(calls) == 1:
+            raise OSError("disk full")
+        real_write_json(path, data)
+
+    monkeypatch.setattr(runner, "write_json", flaky_write_json)
+    state_file = tmp_path / "state.json"
+    writer = runner.StateWriter(state_file, debounce_s=0)
+    writer.start()
+    writer.submit({"done": ["T1-1"]})
+    for _ in range(100):
+        if calls:
+            break
+        time.sleep(0.05)
+    assert writer.is_alive()
+    writer.close()
+    assert json.loads(state_file.read_text()) == {"done": ["T1-1"]}
@@ -0,0 +1,164 @@
+"""Tests for scripts/agentflow.py."""
+
+import importlib.util
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+SCRIPT = Path(__file__).resolve().parents[2] / "scripts" / "agentflow.py"
+
+
+@pytest.fixture(scope="module")
+def agentflow():
+    spec = importlib.util.spec_from_file_location("agentflow", SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"result":"x"}', {"result": "x"}),
+        ('log line\n{"result":"x {y}","session_id":"s"}', {"result": "x {y}", "session_id": "s"}),
+        ('Loaded config {oops\n{"result":"hi","session_id":"s"}', {"result": "hi", "session_id": "s"}),
+        ('prefix "{" quote\n{"result":"x"}', {"result": "x"}),
+        ('noise {\n{"a":{"b":[1,{"c":"}"}]}}', {"a": {"b": [1, {"c": "}"}]}}),
+        ('{"a":1}{"b":2}', {"b": 2}),
+    ],
+)
+def test_try_parse_json_object_finds_trailing_object(agentflow, text, expected):
+    assert agentflow.try_parse_json_object(text) == expected
+
+
+@pytest.mark.parametrize("text", ["", "plain", "{bad", '{"a":1}\ntrailing'])
+def test_try_parse_json_object_rejects_non_trailing_objects(agentflow, text):
+    assert agentflow.try_parse_json_object(text) is None
+
+
+@pytest.mark.parametrize(
+    "stdout, error_summary, expected",
+    [
+        ("working...\nERROR: 429 Too Many Requests\n", None, True),
+        ("[API Error: Rate limit reached for requests]\n", None, True),
+        ('{"type":"error","error":{"code":"RESOURCE_EXHAUSTED"}}\n', None, True),
+        ("", "You exceeded your current quota exceeded", True),
+        ("Added handling for HTTP 429 and rate limit responses.\n", None, False),
+        ("def backoff():\n    # retry on 429 / rate-limit\n", "tests failed", False),
+    ],
+)
+def test_is_rate_limited_only_reads_error_text(agentflow, stdout, error_summary, expected):
+    result = agentflow.RunResult("codex", False, 1, stdout, "", error_summary=error_summary)
+    assert agentflow.is_rate_limited(result) is expected
+
+
+def _flaky_write_state(agentflow, monkeypatch, failures):
+    real_write_state = agentflow._write_state
+    calls = []
+
+    def flaky(path, data, seq, *, durable):
+        calls.append(seq)
+        if len(calls) <= failures:
+            raise OSError("disk full")
+        real_write_state(path, data, seq, durable=durable)
+
+    monkeypatch.setattr(agentflow, "_write_state", flaky)
+    return calls
+
+
+def _wait_for(predicate):
+    for _ in range(100):
+        if predicate():
+            return
+        time.sleep(0.05)
+
+
+def test_state_checkpointer_survives_failed_write(agentflow, tmp_path, monkeypatch):
+    calls = _flaky_write_state(agentflow, monkeypatch, failures=1)
+    state_path = tmp_path / "state.json"
+    checkpointer = agentflow.StateCheckpointer(state_path)
+    checkpointer.start()
+    checkpointer.submit({"cursor": {"task_index": 1}})
+    _wait_for(lambda: calls)
+    assert checkpointer.is_alive()
+    checkpointer.submit({"cursor": {"task_index": 2}})
+    _wait_for(lambda: state_path.exists())
+    checkpointer.close()
+    assert json.loads(state_path.read_text()) == {"cursor": {"task_index": 2}}
+
+
+def test_state_checkpointer_close_retries_failed_write(agentflow, tmp_path, monkeypatch):
+    calls = _flaky_write_state(agentflow, monkeypatch, failures=1)
+    state_path = tmp_path / "state.json"
+    checkpointer = agentflow.StateCheckpointer(state_path)
+    checkpointer.start()
+    checkpointer.submit({"cursor": {"task_index": 1}})
+    _wait_for(lambda: calls)
+    checkpointer.close()
+    assert json.loads(state_path.read_text()) == {"cursor": {"task_index": 1}}
+
+
+def test_state_checkpointer_close_raises_when_write_keeps_failing(agentflow, tmp_path, monkeypatch):
+    calls = _flaky_write_state(agentflow, monkeypatch, failures=2)
+    checkpointer = agentflow.StateCheckpointer(tmp_path / "state.json")
+    checkpointer.start()
+    checkpointer.submit({"cursor": {"task_index": 1}})
+    _wait_for(lambda: calls)
+    with pytest.raises(OSError):
+        checkpointer.close()
+
+
+def test_superseded_durable_write_still_syncs(agentflow, tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(agentflow, "_fdatasync", lambda fd: synced.append(fd))
+    state_path = tmp_path / "state.json"
+    agentflow._write_state(state_path, b'{"step":2}', 2, durable=False)
+    agentflow._write_state(state_path, b'{"step":1}', 1, durable=True)
+    assert state_path.read_bytes() == b'{"step":2}'
+    assert synced
+    assert agentflow._saved_state[state_path] == (2, b'{"step":2}', True)
+
+
+def _engine(agentflow, tmp_path):
+    return agentflow.Engine(
+        repo=tmp_path,
+        app_dir=tmp_path,
+        include_dirs=[],
+        autonomy="full",
+        models={},
+        verbose=False,
+        gemini_resume=None,
+        claude_allowed_tools=None,
+    )
+
+
+def _throttle(agentflow, engine, name):
+    engine.record_result(agentflow.RunResult(name, False, 1, "ERROR: 429 Too Many Requests\n", ""))
+
+
+def test_usable_engines_skips_throttled_engine_while_another_is_free(agentflow, tmp_path):
+    engine = _engine(agentflow, tmp_path)
+    _throttle(agentflow, engine, "codex")
+    assert engine.usable_engines(["codex", "claude", "gemini"]) == ["claude", "gemini"]
+
+
+def test_usable_engines_orders_by_backoff_when_all_are_throttled(agentflow, tmp_path):
+    engine = _engine(agentflow, tmp_path)
+    _throttle(agentflow, engine, "claude")
+    _throttle(agentflow, engine, "codex")
+    _throttle(agentflow, engine, "codex")
+    assert engine.usable_engines(["codex", "claude"]) == ["claude", "codex"]
+
+
+def test_wait_for_slot_returns_on_stop(agentflow, tmp_path):
+    engine = _engine(agentflow, tmp_path)
+    _throttle(agentflow, engine, "codex")
+    controls = agentflow.ControlFiles(tmp_path)
+    controls.stop_path.write_text("stop\n")
+    started = time.monotonic()
+    assert engine.wait_for_slot("codex", controls) is False
+    assert time.monotonic() - started < 5